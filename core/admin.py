@@ -1,11 +1,13 @@
 # core/admin.py
 
 from django.contrib import admin
-from .models import Post, Comment, Like
+from .models import Post, Comment, Like, Job, VideoUpload
 
 # Register your models here.
 admin.site.register(Post)
 admin.site.register(Comment)
 admin.site.register(Like)
+admin.site.register(Job)
+admin.site.register(VideoUpload)
 
 
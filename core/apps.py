@@ -6,6 +6,8 @@ class CoreConfig(AppConfig):
     label = 'core'
 
     def ready(self):
+        import core.checks
         import core.signals
+        import core.tasks
 
 
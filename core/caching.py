@@ -0,0 +1,106 @@
+# core/caching.py
+#
+# Helpers shared by everything that caches (sidebar, fragments, suggestions,
+# ...), on top of the named caches configured in settings.CACHES.
+#
+# Versioned keys: a namespace (one user's sidebar, one post's card) has a
+# version number stored in the cache, and its keys embed it. Invalidating
+# the namespace is one incr; stale entries are never hunted down, they just
+# stop being read and expire. A version that was evicted restarts from the
+# clock rather than from 1, so it can't bring back entries of an earlier
+# life.
+#
+# get_or_compute: a read-through get with stampede protection. Values are
+# stored with a soft expiry ahead of the real one. Once it passes, the first
+# reader to take a short lock recomputes while everyone else keeps getting
+# the stale value; on a cold miss, readers that lose the lock wait briefly
+# for the winner's value instead of all hitting the database at once.
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+LOCK_TIMEOUT = 30
+WAIT_INTERVAL = 0.05
+
+
+def get_cache(alias):
+    """caches[alias], or the default cache for an alias that isn't configured."""
+    return caches[alias if alias in settings.CACHES else 'default']
+
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_versions(cache, namespaces):
+    """{namespace: current version} for each namespace, in two round trips at most."""
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in found.items()}
+
+
+def get_version(cache, namespace):
+    return get_versions(cache, [namespace])[namespace]
+
+
+def bump_versions(cache, namespaces):
+    for namespace in set(namespaces):
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            # Not set: the next read starts a fresh version anyway.
+            pass
+
+
+def versioned_key(cache, namespace, *parts, version=None):
+    """'namespace:v<version>[:part...]' with the namespace's current version."""
+    if version is None:
+        version = get_version(cache, namespace)
+    return ':'.join([namespace, f'v{version}', *map(str, parts)])
+
+
+def get_or_compute(cache, key, compute, timeout, stale_ttl=None, wait=1.0):
+    """
+    cache.get(key), calling compute() and storing its result on a miss.
+
+    The value is treated as fresh for timeout seconds and kept for another
+    stale_ttl (default: a tenth of timeout) during which it is served while
+    one caller refreshes it. On a cold miss only the caller holding the lock
+    computes; others poll for up to `wait` seconds, then compute anyway.
+    """
+    if stale_ttl is None:
+        stale_ttl = max(1, timeout // 10)
+    lock_key = f'{key}:lock'
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until or not cache.add(lock_key, True, LOCK_TIMEOUT):
+            return value
+        return _store(cache, key, lock_key, compute, timeout, stale_ttl)
+
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        return _store(cache, key, lock_key, compute, timeout, stale_ttl)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def _store(cache, key, lock_key, compute, timeout, stale_ttl):
+    try:
+        value = compute()
+        cache.set(key, (value, time.time() + timeout), timeout + stale_ttl)
+    finally:
+        cache.delete(lock_key)
+    return value
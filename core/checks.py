@@ -0,0 +1,33 @@
+# core/checks.py
+#
+# System checks for deployment settings that Django can't know about.
+
+from django.conf import settings
+from django.core import checks
+
+# State other processes read or invalidate: the typeahead journal (default),
+# the friend graph and the like buffer. A per-process cache there means
+# changes made in one process are never seen by the others.
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def _shared_aliases():
+    return sorted({'default', settings.FRIEND_GRAPH_CACHE, settings.LIKE_BUFFER_CACHE})
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    if settings.DEBUG:
+        return []
+    local = [
+        alias for alias in _shared_aliases()
+        if settings.CACHES.get(alias, settings.CACHES['default'])['BACKEND'] in LOCAL_BACKENDS
+    ]
+    if not local:
+        return []
+    return [checks.Warning(
+        f"Caches {', '.join(local)} are local to each process.",
+        hint="Set CACHE_URL (redis or memcached) or CACHE_BACKEND='file' so every "
+             "web and worker process shares them.",
+        id='core.W001',
+    )]
@@ -1,12 +1,15 @@
-from .models import UserProfile, FriendRequest
+from django.utils.functional import SimpleLazyObject
+
+from .sidebar import sidebar_friends
+
 
 def sidebar_data(request):
+    # Lazy: nothing is read unless the template actually renders the
+    # sidebar, and then it is one cache hit in the common case.
     if request.user.is_authenticated:
-        sent = FriendRequest.objects.filter(sender=request.user, accepted=True).values_list('receiver', flat=True)
-        received = FriendRequest.objects.filter(receiver=request.user, accepted=True).values_list('sender', flat=True)
-        friend_ids = set(sent) | set(received)  # Combine sender and receiver
-        friends = UserProfile.objects.filter(user__id__in=friend_ids)
+        user_id = request.user.pk
+        friends = SimpleLazyObject(lambda: sidebar_friends(user_id))
     else:
-        friends = UserProfile.objects.none()
+        friends = []
 
     return {'sidebar_friends': friends}
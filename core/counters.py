@@ -0,0 +1,97 @@
+# core/counters.py
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .fragments import invalidate_post_cards
+from .models import Comment, Like, Post, UserProfile
+
+
+def adjust_like_count(post_ids, delta):
+    """
+    Shift like_count on the given posts by delta in a single UPDATE. The
+    arithmetic happens in the database, so concurrent likes never lose
+    updates; the floor at zero keeps a drifted counter from breaking the
+    request that happens to expose it.
+    """
+    Post.objects.filter(pk__in=post_ids).update(
+        like_count=Greatest(F('like_count') + delta, Value(0))
+    )
+
+
+def adjust_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=Greatest(F('comment_count') + delta, Value(0))
+    )
+
+
+def release_user_comments(user_id):
+    """
+    Take a user's comments off the counts of other users' posts in one
+    UPDATE, before the rows are cascaded away with the account (their own
+    posts go too). Returns the ids of the posts adjusted.
+    """
+    rows = Comment.objects.filter(post=OuterRef('pk'), user_id=user_id).order_by()
+    posts = Post.objects.filter(
+        pk__in=Comment.objects.filter(user_id=user_id).values('post_id'),
+    ).exclude(user_id=user_id)
+    post_ids = list(posts.values_list('pk', flat=True))
+    Post.objects.filter(pk__in=post_ids).update(comment_count=Greatest(
+        F('comment_count') - Subquery(rows.values('post').annotate(n=Count('*')).values('n')),
+        Value(0),
+    ))
+    return post_ids
+
+
+def recount_friends(profile_ids):
+    """Set friend_count on the given profiles from the friends table."""
+    rows = UserProfile.friends.through.objects.filter(
+        from_userprofile=OuterRef('pk')
+    ).order_by()
+    UserProfile.objects.filter(pk__in=profile_ids).update(
+        friend_count=Coalesce(Subquery(
+            rows.values('from_userprofile').annotate(n=Count('*')).values('n')
+        ), 0)
+    )
+
+
+def actual_like_count():
+    rows = Like.objects.filter(post=OuterRef('pk')).order_by()
+    return Coalesce(Subquery(rows.values('post').annotate(n=Count('*')).values('n')), 0)
+
+
+def actual_comment_count():
+    rows = Comment.objects.filter(post=OuterRef('pk')).order_by()
+    return Coalesce(Subquery(rows.values('post').annotate(n=Count('*')).values('n')), 0)
+
+
+def reconcile_post_counters(batch_size=1000):
+    """
+    Recount likes and comments for every post and fix the ones that have
+    drifted. Works through the table in primary key ranges, two queries per
+    batch. Returns the number of posts corrected.
+    """
+    fixed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Post.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return fixed
+        last_pk = batch[-1]
+
+        drifted = list(
+            Post.objects.filter(pk__in=batch)
+            .annotate(real_likes=actual_like_count(), real_comments=actual_comment_count())
+            .filter(~Q(like_count=F('real_likes')) | ~Q(comment_count=F('real_comments')))
+            .values_list('pk', flat=True)
+        )
+        if drifted:
+            fixed += Post.objects.filter(pk__in=drifted).update(
+                like_count=actual_like_count(),
+                comment_count=actual_comment_count(),
+            )
+            invalidate_post_cards(drifted)
@@ -0,0 +1,91 @@
+# core/fragments.py
+#
+# Rendered post cards cached in the POST_CARD_CACHE cache, so a page of
+# posts is mostly a get_many and a join. A card is the same for every
+# viewer except for a few slots (whether the viewer liked the post, its
+# relative age) that are left as markers in the cached HTML and filled in
+# per request.
+#
+# Card keys carry two version numbers (see core.caching): the post's, bumped
+# after it is saved, liked or commented on, and its author's, bumped when
+# the author's name or picture changes.
+
+from django.conf import settings
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import bump_versions, get_cache, get_versions
+
+LIKE_ICON_TEMPLATE = 'like_icon.html'
+SLOTS = {
+    'liked': '<!--post-card:liked-->',
+    'age': '<!--post-card:age-->',
+}
+
+
+def fragment_cache():
+    return get_cache(settings.POST_CARD_CACHE)
+
+
+def _post_namespace(post_id):
+    return f'post_card:{post_id}'
+
+
+def _author_namespace(user_id):
+    return f'post_card_author:{user_id}'
+
+
+def invalidate_post_cards(post_ids):
+    """Re-render these posts' cards once the current transaction commits."""
+    namespaces = [_post_namespace(post_id) for post_id in post_ids]
+    transaction.on_commit(lambda: bump_versions(fragment_cache(), namespaces))
+
+
+def invalidate_author_cards(user_ids):
+    namespaces = [_author_namespace(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: bump_versions(fragment_cache(), namespaces))
+
+
+def render_post_cards(posts, template_name):
+    """
+    The cards for posts, rendered with template_name and joined, with the
+    per-viewer slots filled in from post.liked_by_user.
+    """
+    posts = list(posts)
+    if not posts:
+        return ''
+    cache = fragment_cache()
+    versions = get_versions(
+        cache,
+        [_post_namespace(post.pk) for post in posts]
+        + [_author_namespace(post.user_id) for post in posts],
+    )
+    keys = {
+        post.pk: 'post_card:{}:{}:v{}:a{}'.format(
+            template_name, post.pk,
+            versions[_post_namespace(post.pk)], versions[_author_namespace(post.user_id)],
+        )
+        for post in posts
+    }
+    cards = cache.get_many(keys.values())
+
+    rendered = {}
+    slots = {name: mark_safe(marker) for name, marker in SLOTS.items()}
+    for post in posts:
+        if keys[post.pk] not in cards:
+            rendered[keys[post.pk]] = render_to_string(template_name, {'post': post, 'slots': slots})
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(rendered)
+
+    icons = {state: render_to_string(LIKE_ICON_TEMPLATE, {'liked': state}) for state in (False, True)}
+    html = []
+    for post in posts:
+        html.append(
+            cards[keys[post.pk]]
+            .replace(SLOTS['liked'], icons[bool(getattr(post, 'liked_by_user', False))])
+            .replace(SLOTS['age'], str(naturaltime(post.created_at)))
+        )
+    return mark_safe(''.join(html))
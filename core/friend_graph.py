@@ -0,0 +1,125 @@
+# core/friend_graph.py
+#
+# The friends graph held in the FRIEND_GRAPH_CACHE cache as one sorted array
+# of friend user ids per user, so friendship checks, mutual friends and
+# friend counts don't query the userprofile_friends table. A user's array is
+# loaded from the database on first use and dropped by the m2m_changed
+# signal (see core.signals) when a friendship of theirs changes, then again
+# once the change commits.
+#
+# The arrays can lag the database for a moment, which is fine for counts
+# and suggestions but not for deciding who may see what: access checks use
+# db_are_friends and db_friend_ids instead.
+#
+# Keys are user ids rather than profile ids: that is what views have to hand.
+
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import get_cache
+from .models import UserProfile
+
+Friendship = UserProfile.friends.through
+
+
+def graph_cache():
+    return get_cache(settings.FRIEND_GRAPH_CACHE)
+
+
+def _key(user_id):
+    return f'friend_graph:{user_id}'
+
+
+def _load(user_ids):
+    """Read the friend lists of user_ids from the database, in one query."""
+    lists = {user_id: [] for user_id in user_ids}
+    rows = (
+        Friendship.objects.filter(from_userprofile__user_id__in=user_ids)
+        .values_list('from_userprofile__user_id', 'to_userprofile__user_id')
+    )
+    for user_id, friend_id in rows:
+        lists[user_id].append(friend_id)
+    return {user_id: array('q', sorted(ids)) for user_id, ids in lists.items()}
+
+
+def friend_ids_many(user_ids):
+    """{user_id: sorted array of friend user ids}, loading any misses."""
+    cache = graph_cache()
+    keys = {_key(user_id): user_id for user_id in user_ids}
+    found = {keys[key]: ids for key, ids in cache.get_many(keys).items()}
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        loaded = _load(missing)
+        cache.set_many({_key(user_id): ids for user_id, ids in loaded.items()},
+                       settings.FRIEND_GRAPH_TIMEOUT)
+        found.update(loaded)
+    return found
+
+
+def friend_ids(user_id):
+    return friend_ids_many([user_id])[user_id]
+
+
+def friend_count(user_id):
+    return len(friend_ids(user_id))
+
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+def are_friends(user_a_id, user_b_id):
+    return _contains(friend_ids(user_a_id), user_b_id)
+
+
+def mutual_friend_ids(user_a_id, user_b_id):
+    """Friends the two users share, by a merge of their sorted arrays."""
+    lists = friend_ids_many([user_a_id, user_b_id])
+    a, b = lists[user_a_id], lists[user_b_id]
+    i = j = 0
+    mutual = []
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            mutual.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return mutual
+
+
+def db_are_friends(user_a_id, user_b_id):
+    """are_friends, read from the database."""
+    return Friendship.objects.filter(
+        from_userprofile__user_id=user_a_id, to_userprofile__user_id=user_b_id,
+    ).exists()
+
+
+def db_friend_ids(user_id):
+    """The user's friend ids as a subquery, read from the database."""
+    return Friendship.objects.filter(from_userprofile__user_id=user_id).values('to_userprofile__user_id')
+
+
+def record_change(profile_ids):
+    """Drop the cached arrays of profiles whose friendships changed."""
+    user_ids = list(
+        UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True)
+    )
+    if not user_ids:
+        return
+    # Drop the arrays now so this transaction reads its own change from the
+    # database, and again on commit, since another process may have cached
+    # the old lists in between. Patching them in place instead would be a
+    # read-modify-write that loses concurrent changes.
+    forget(user_ids)
+    transaction.on_commit(lambda: forget(user_ids))
+
+
+def forget(user_ids):
+    graph_cache().delete_many([_key(user_id) for user_id in user_ids])
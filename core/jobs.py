@@ -0,0 +1,137 @@
+# core/jobs.py
+#
+# A small database-backed job queue. Jobs are rows in core_job, written in
+# the same transaction as whatever they describe, and claimed by
+# `manage.py run_worker` processes with a conditional UPDATE so two workers
+# never run the same job. Handlers are registered with @handler (see
+# core.tasks).
+
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def handler(kind, on_failure=None):
+    """
+    Register the decorated function as the handler for jobs of `kind`. It
+    is called with the job's payload as keyword arguments. on_failure, if
+    given, is called with the same arguments once all attempts are used up.
+    """
+    def register(func):
+        _handlers[kind] = (func, on_failure)
+        return func
+    return register
+
+
+def enqueue(kind, max_attempts=None, delay=None, **payload):
+    """Queue a job; with delay (seconds) it won't run before then."""
+    job = Job.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay or 0),
+    )
+    if settings.JOBS_RUN_INLINE:
+        transaction.on_commit(lambda: run_job(job.pk))
+    return job
+
+
+def is_queued(kind):
+    return Job.objects.filter(kind=kind, status=Job.QUEUED).exists()
+
+
+def claim(batch_size=10):
+    """
+    Take the oldest runnable job. Returns the Job, now marked running, or
+    None if the queue is empty.
+    """
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .order_by('run_after', 'pk')
+        .values_list('pk', flat=True)[:batch_size]
+    )
+    for pk in candidates:
+        won = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if won:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job (or a job id, in inline mode) and record the outcome."""
+    if not isinstance(job, Job):
+        if not Job.objects.filter(pk=job, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_at=timezone.now(), attempts=F('attempts') + 1,
+        ):
+            return
+        job = Job.objects.get(pk=job)
+
+    func, on_failure = _handlers.get(job.kind, (None, None))
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for job kind {job.kind!r}.")
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s failed (attempt %s/%s)", job, job.attempts, job.max_attempts)
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, locked_at=None, last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, locked_at=None, last_error=error,
+            )
+            if on_failure is not None:
+                on_failure(**job.payload)
+        return False
+
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, locked_at=None, last_error='')
+    return True
+
+
+def requeue_stale():
+    """Put back jobs whose worker died while running them."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_at=None,
+    )
+
+
+def work(burst=False, sleep=1.0, should_stop=lambda: False):
+    """
+    Claim and run jobs until should_stop() is true. With burst=True, return
+    as soon as the queue is empty. Returns the number of jobs run.
+    """
+    processed = 0
+    last_sweep = 0.0
+    while not should_stop():
+        if time.monotonic() - last_sweep > 60:
+            requeue_stale()
+            last_sweep = time.monotonic()
+        job = claim()
+        if job is None:
+            if burst:
+                break
+            time.sleep(sleep)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
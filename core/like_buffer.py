@@ -0,0 +1,213 @@
+# core/like_buffer.py
+#
+# Write-behind buffering of likes, enabled with LIKES_WRITE_BEHIND. Instead
+# of inserting a Like row and updating Post.like_count on every click, a
+# toggle is appended to a journal in the LIKE_BUFFER_CACHE cache and the
+# flush_likes job writes the journal to the database in bulk every
+# LIKE_FLUSH_INTERVAL seconds. Until then readers see the buffered state:
+# the viewer's own liked flag and a per-post count delta are kept in the
+# same cache and laid over what the database says.
+#
+# The buffer lives in the cache, so with several processes it needs a
+# shared backend (memcached, redis); with the per-process local-memory cache
+# only the process that buffered a like can flush it.
+#
+# Keys:
+#   likebuf:seq             last journal sequence number handed out
+#   likebuf:flushed         last sequence number written to the database
+#   likebuf:entry:<n>       (user_id, post_id, liked, delta)
+#   likebuf:state:<u>:<p>   the user's latest buffered liked flag
+#   likebuf:delta:<p>       net count change not yet in Post.like_count
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .caching import get_cache
+from .counters import adjust_like_count
+from .fragments import invalidate_post_cards
+from .models import Like, Post
+
+FLUSH_BATCH_SIZE = 1000
+STATE_TIMEOUT = 24 * 60 * 60
+
+
+def enabled():
+    return settings.LIKES_WRITE_BEHIND
+
+
+def buffer_cache():
+    return get_cache(settings.LIKE_BUFFER_CACHE)
+
+
+def _state_key(user_id, post_id):
+    return f'likebuf:state:{user_id}:{post_id}'
+
+
+def _delta_key(post_id):
+    return f'likebuf:delta:{post_id}'
+
+
+def _incr(cache, key, delta):
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key, delta)
+
+
+def buffered_states(user_id, post_ids):
+    """{post_id: liked} for posts the user has toggled since the last flush."""
+    cache = buffer_cache()
+    keys = {_state_key(user_id, pk): pk for pk in post_ids}
+    return {keys[key]: liked for key, liked in cache.get_many(keys).items()}
+
+
+def buffered_deltas(post_ids):
+    """{post_id: count change} still waiting to be flushed."""
+    keys = {_delta_key(pk): pk for pk in post_ids}
+    return {keys[key]: delta for key, delta in buffer_cache().get_many(keys).items() if delta}
+
+
+def apply_buffered_counts(posts):
+    """Add buffered deltas to like_count on the given Post instances."""
+    deltas = buffered_deltas([post.pk for post in posts])
+    for post in posts:
+        post.like_count = max(0, post.like_count + deltas.get(post.pk, 0))
+    return posts
+
+
+def toggle(user, post, like_count):
+    """
+    Buffer a flip of user's like on post. like_count is the post's count as
+    stored in the database. Returns (liked, like_count) as readers will see
+    it.
+    """
+    cache = buffer_cache()
+    liked = cache.get(_state_key(user.pk, post.pk))
+    if liked is None:
+        liked = Like.objects.filter(user=user, post=post).exists()
+    liked = not liked
+    delta = 1 if liked else -1
+
+    cache.set(_state_key(user.pk, post.pk), liked, timeout=STATE_TIMEOUT)
+    sequence = _incr(cache, 'likebuf:seq', 1)
+    cache.set(f'likebuf:entry:{sequence}', (user.pk, post.pk, liked, delta), timeout=None)
+    pending = _incr(cache, _delta_key(post.pk), delta)
+    _schedule_flush(cache)
+    return liked, max(0, like_count + pending)
+
+
+def _schedule_flush(cache, force=False):
+    # At most one enqueue attempt per interval, so buffered likes don't
+    # turn into a job-table write each.
+    if force or cache.add('likebuf:scheduled', True, timeout=settings.LIKE_FLUSH_INTERVAL):
+        from .jobs import enqueue, is_queued
+        if not is_queued('flush_likes'):
+            enqueue('flush_likes', delay=settings.LIKE_FLUSH_INTERVAL)
+
+
+def _read_journal(cache):
+    start = cache.get('likebuf:flushed', 0)
+    end = cache.get('likebuf:seq', 0)
+    numbers = list(range(start + 1, end + 1))[:FLUSH_BATCH_SIZE * 10]
+    entries = {}
+    for offset in range(0, len(numbers), FLUSH_BATCH_SIZE):
+        keys = [f'likebuf:entry:{n}' for n in numbers[offset:offset + FLUSH_BATCH_SIZE]]
+        entries.update(cache.get_many(keys))
+
+    # Stop at the first gap: its writer has taken a number but not stored
+    # the entry yet. A gap still there on the next flush is given up on.
+    journal, last = [], start
+    stalled = cache.get('likebuf:stalled')
+    for n in numbers:
+        entry = entries.get(f'likebuf:entry:{n}')
+        if entry is None:
+            if stalled != n:
+                cache.set('likebuf:stalled', n, timeout=None)
+                break
+        else:
+            journal.append(entry)
+        last = n
+    return journal, start, last
+
+
+def flush():
+    """
+    Write buffered likes to the database. Only the last toggle of each
+    (user, post) pair matters: likes are bulk-inserted with
+    ignore_conflicts, unlikes deleted, and like_count adjusted by what
+    actually changed. Returns the number of journal entries flushed.
+    """
+    cache = buffer_cache()
+    if not cache.add('likebuf:lock', True, timeout=60):
+        return 0
+    try:
+        journal, start, last = _read_journal(cache)
+        if journal:
+            _write(journal)
+        cache.set('likebuf:flushed', last, timeout=None)
+        cache.delete_many([f'likebuf:entry:{n}' for n in range(start + 1, last + 1)])
+    finally:
+        cache.delete('likebuf:lock')
+    if cache.get('likebuf:seq', 0) > last:
+        _schedule_flush(cache, force=True)
+    return len(journal)
+
+
+def _write(journal):
+    final, pending = {}, defaultdict(int)
+    for user_id, post_id, liked, delta in journal:
+        final[user_id, post_id] = liked
+        pending[post_id] += delta
+
+    with transaction.atomic():
+        # A post or user deleted since the toggle took its likes with it;
+        # inserting for them would fail the foreign key on every flush.
+        live_posts = set(Post.objects.filter(pk__in=pending).values_list('pk', flat=True))
+        live_users = set(
+            get_user_model().objects.filter(pk__in={u for u, _ in final}).values_list('pk', flat=True)
+        )
+        final = {
+            (user_id, post_id): liked for (user_id, post_id), liked in final.items()
+            if user_id in live_users and post_id in live_posts
+        }
+        existing = set(
+            Like.objects.filter(
+                user_id__in={u for u, _ in final}, post_id__in={p for _, p in final},
+            ).values_list('user_id', 'post_id')
+        )
+        added = [pair for pair, liked in final.items() if liked and pair not in existing]
+        removed = defaultdict(list)
+        for (user_id, post_id), liked in final.items():
+            if not liked and (user_id, post_id) in existing:
+                removed[post_id].append(user_id)
+
+        Like.objects.bulk_create(
+            [Like(user_id=u, post_id=p) for u, p in added],
+            batch_size=FLUSH_BATCH_SIZE, ignore_conflicts=True,
+        )
+        for post_id, user_ids in removed.items():
+            Like.objects.filter(post_id=post_id, user_id__in=user_ids).delete()
+
+        changes = defaultdict(int)
+        for _, post_id in added:
+            changes[post_id] += 1
+        for post_id, user_ids in removed.items():
+            changes[post_id] -= len(user_ids)
+        by_change = defaultdict(list)
+        for post_id, change in changes.items():
+            if change:
+                by_change[change].append(post_id)
+        for change, post_ids in by_change.items():
+            adjust_like_count(post_ids, change)
+        invalidate_post_cards([post_id for post_id, change in changes.items() if change])
+
+    # The database now carries these changes; stop adding them on top.
+    cache = buffer_cache()
+    cache.delete_many([_delta_key(post_id) for post_id in pending if post_id not in live_posts])
+    for post_id, delta in pending.items():
+        if delta and post_id in live_posts:
+            try:
+                cache.decr(_delta_key(post_id), delta)
+            except ValueError:
+                pass
@@ -0,0 +1,201 @@
+# core/likes.py
+#
+# Every read and write of like state goes through this module. Like rows are
+# the only store; Post.like_count is the denormalized total and is adjusted
+# here in the same transaction as the row it counts. With LIKES_WRITE_BEHIND
+# toggles are buffered by core.like_buffer instead, and the readers below
+# lay the buffered state over the database's.
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import like_buffer
+from .counters import adjust_like_count
+from .fragments import invalidate_post_cards
+from .models import Like, Post
+
+
+def liked_post_ids(user, post_ids):
+    """Return the subset of post_ids that user has liked, in one IN query."""
+    if not user.is_authenticated or not post_ids:
+        return set()
+    liked = set(
+        Like.objects.filter(user=user, post_id__in=post_ids)
+        .values_list('post_id', flat=True)
+    )
+    if like_buffer.enabled():
+        for post_id, buffered in like_buffer.buffered_states(user.pk, post_ids).items():
+            (liked.add if buffered else liked.discard)(post_id)
+    return liked
+
+
+def annotate_liked(queryset, user):
+    """Add a liked_by_user boolean to a Post queryset."""
+    if not user.is_authenticated:
+        return queryset.annotate(liked_by_user=Exists(Like.objects.none()))
+    return queryset.annotate(
+        liked_by_user=Exists(Like.objects.filter(user=user, post=OuterRef('pk')))
+    )
+
+
+def like_states(user, post_ids):
+    """
+    {post_id: (like_count, liked_by_user)} for the posts in post_ids that
+    exist, read in a single query: an IN over posts with the user's like
+    checked per row by a correlated EXISTS on the (user, post) index.
+    """
+    if not post_ids:
+        return {}
+    rows = annotate_liked(Post.objects.filter(pk__in=post_ids), user)
+    states = {
+        pk: (like_count, liked)
+        for pk, like_count, liked in rows.values_list('pk', 'like_count', 'liked_by_user')
+    }
+    if like_buffer.enabled() and states:
+        deltas = like_buffer.buffered_deltas(list(states))
+        flags = like_buffer.buffered_states(user.pk, list(states)) if user.is_authenticated else {}
+        for pk, (like_count, liked) in states.items():
+            states[pk] = (max(0, like_count + deltas.get(pk, 0)), flags.get(pk, liked))
+    return states
+
+
+def likes_by(user):
+    return Like.objects.filter(user=user).select_related('post')
+
+
+def toggle_like(user, post):
+    """
+    Flip user's like on post. Returns (liked, like_count).
+
+    The toggle never reads like state first. It deletes the (user, post)
+    row and, only if there was none, inserts it, both keyed on the unique
+    index; the post's counter is then shifted by the outcome and read back
+    with UPDATE ... RETURNING. On PostgreSQL all of that is one statement;
+    elsewhere it is two or three short statements in one transaction. Cost
+    is independent of how many likes the post has.
+    """
+    liked, like_count = _toggle(user, post)
+    invalidate_post_cards([post.pk])
+    return liked, like_count
+
+
+def _toggle(user, post):
+    if like_buffer.enabled():
+        like_count = Post.objects.filter(pk=post.pk).values_list('like_count', flat=True).get()
+        return like_buffer.toggle(user, post, like_count)
+
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            return _toggle_postgresql(user.pk, post.pk)
+        deleted = _delete_like(user.pk, post.pk)
+        if deleted:
+            delta = -deleted
+        else:
+            # Zero rows inserted means a concurrent request liked it first.
+            delta = _insert_like(user.pk, post.pk)
+        return not deleted, _shift_like_count(post.pk, delta)
+
+
+def _like_table():
+    return connection.ops.quote_name(Like._meta.db_table)
+
+
+def _post_table():
+    return connection.ops.quote_name(Post._meta.db_table)
+
+
+def _delete_like(user_id, post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {_like_table()} WHERE user_id = %s AND post_id = %s",
+            [user_id, post_id],
+        )
+        return cursor.rowcount
+
+
+# Inserts that skip a row the unique (user, post) index already has,
+# spelled out per backend. PostgreSQL has its own path (_toggle_postgresql).
+INSERT_IGNORE = {
+    'sqlite': 'INSERT OR IGNORE INTO',
+    'mysql': 'INSERT IGNORE INTO',
+}
+
+
+def _insert_like(user_id, post_id):
+    """Insert the like unless it exists; returns the number of rows added."""
+    if connection.vendor not in INSERT_IGNORE:
+        try:
+            with transaction.atomic():
+                Like.objects.create(user_id=user_id, post_id=post_id)
+        except IntegrityError:
+            return 0
+        return 1
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{INSERT_IGNORE[connection.vendor]} {_like_table()} "
+            f"(user_id, post_id, created_at) VALUES (%s, %s, %s)",
+            [user_id, post_id, connection.ops.adapt_datetimefield_value(timezone.now())],
+        )
+        return cursor.rowcount
+
+
+def _update_returning():
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return connection.vendor == 'postgresql'
+
+
+def _shift_like_count(post_id, delta):
+    if not _update_returning():
+        if delta:
+            adjust_like_count([post_id], delta)
+        return Post.objects.filter(pk=post_id).values_list('like_count', flat=True).get()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {_post_table()} SET like_count = "
+            f"CASE WHEN like_count + %s < 0 THEN 0 ELSE like_count + %s END "
+            f"WHERE id = %s RETURNING like_count",
+            [delta, delta, post_id],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _toggle_postgresql(user_id, post_id):
+    # Data-modifying CTEs: delete the like if present, otherwise insert it,
+    # and move the counter by what happened, in one round trip.
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH removed AS (
+                DELETE FROM {_like_table()} WHERE user_id = %s AND post_id = %s RETURNING 1
+            ), added AS (
+                INSERT INTO {_like_table()} (user_id, post_id, created_at)
+                SELECT %s, %s, %s WHERE NOT EXISTS (SELECT 1 FROM removed)
+                ON CONFLICT DO NOTHING RETURNING 1
+            )
+            UPDATE {_post_table()}
+            SET like_count = GREATEST(
+                like_count + (SELECT COUNT(*) FROM added) - (SELECT COUNT(*) FROM removed), 0)
+            WHERE id = %s
+            RETURNING like_count, NOT EXISTS (SELECT 1 FROM removed)
+            """,
+            [user_id, post_id, user_id, post_id, now, post_id],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return False, 0
+    like_count, liked = row
+    return liked, like_count
+
+
+def forget_user(user):
+    """
+    Take a user's likes off the counters before the rows are cascaded away
+    with the account.
+    """
+    post_ids = list(Like.objects.filter(user=user).values_list('post_id', flat=True))
+    adjust_like_count(Like.objects.filter(user=user).values('post'), -1)
+    invalidate_post_cards(post_ids)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.fragments import invalidate_post_cards
+from core.media import describe_media
+from core.models import Post
+
+FIELDS = ['media_kind', 'media_mime', 'media_width', 'media_height', 'media_duration']
+
+
+class Command(BaseCommand):
+    help = "Fill Post media_* fields for posts uploaded before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--all', action='store_true',
+                            help="Re-describe every post with media, not just undescribed ones.")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(Q(image__gt='') | Q(video__gt=''))
+        if not options['all']:
+            posts = posts.filter(media_mime='')
+
+        batch, done = [], 0
+        for post in posts.order_by('pk').iterator(chunk_size=options['batch_size']):
+            describe_media(post)
+            for field_file in (post.image, post.video):
+                if field_file:
+                    field_file.close()
+            batch.append(post)
+            if len(batch) >= options['batch_size']:
+                done += self.save(batch)
+                batch = []
+        if batch:
+            done += self.save(batch)
+        self.stdout.write(self.style.SUCCESS(f"Described media on {done} post(s)."))
+
+    def save(self, posts):
+        # bulk_update skips post_save, so the cards are dropped here.
+        updated = Post.objects.bulk_update(posts, FIELDS)
+        invalidate_post_cards([post.pk for post in posts])
+        return updated
@@ -0,0 +1,58 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.likes import toggle_like
+from core.models import Like, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        "Time toggle_like on a post as its like count grows. Everything is "
+        "created inside a transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 1000, 100000, 1000000],
+                            help="Like counts to measure at.")
+        parser.add_argument('--toggles', type=int, default=200,
+                            help="Toggles timed at each size.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(sorted(options['sizes']), options['toggles'])
+            transaction.set_rollback(True)
+
+    def run(self, sizes, toggles):
+        author = User.objects.create_user('bench_author')
+        clicker = User.objects.create_user('bench_clicker')
+        post = Post.objects.create(user=author, content='benchmark')
+
+        self.stdout.write(f"{'likes':>10} {'median µs':>10} {'p95 µs':>10}")
+        likes = 0
+        for size in sizes:
+            while likes < size:
+                n = min(BATCH_SIZE, size - likes)
+                users = User.objects.bulk_create([
+                    User(username=f'bench_{likes + i}', password='!') for i in range(n)
+                ])
+                Like.objects.bulk_create([Like(user=user, post=post) for user in users])
+                likes += n
+            Post.objects.filter(pk=post.pk).update(like_count=likes)
+
+            timings = []
+            for _ in range(toggles):
+                start = time.perf_counter()
+                toggle_like(clicker, post)
+                timings.append((time.perf_counter() - start) * 1e6)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            self.stdout.write(f"{likes:>10} {statistics.median(timings):>10.0f} {p95:>10.0f}")
@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import FriendRequest, UserProfile
+from core.suggestions import Friendship, replace_stored_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute friend-of-friend suggestions for every user with a sparse "
+        "A·A over the friends graph (needs numpy and scipy)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=None,
+                            help="Suggestions kept per user (default FRIEND_SUGGESTIONS_LIMIT).")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Users whose rows are multiplied at a time.")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Processes that rank chunks in parallel.")
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            import scipy.sparse as sp
+
+            from core.friend_matrix import init_worker, rank_chunk
+        except ImportError:
+            raise CommandError("build_friend_suggestions needs numpy and scipy installed.")
+
+        top_k = options['top_k'] or settings.FRIEND_SUGGESTIONS_LIMIT
+        chunk_size = max(1, options['chunk_size'])
+        started = time.monotonic()
+
+        profiles = list(UserProfile.objects.order_by('pk').values_list('pk', 'user_id'))
+        n = len(profiles)
+        if not n:
+            return
+        index_of_profile = {profile_id: i for i, (profile_id, _) in enumerate(profiles)}
+        index_of_user = {user_id: i for i, (_, user_id) in enumerate(profiles)}
+        user_ids = [user_id for _, user_id in profiles]
+
+        pairs = np.array(
+            [(index_of_profile[a], index_of_profile[b]) for a, b in
+             Friendship.objects.values_list('from_userprofile_id', 'to_userprofile_id').iterator()],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        adjacency = sp.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int32), (pairs[:, 0], pairs[:, 1])), shape=(n, n),
+        )
+
+        requests = np.array(
+            [(index_of_user[a], index_of_user[b]) for a, b in
+             FriendRequest.objects.filter(accepted=False).values_list('sender_id', 'receiver_id')
+             if a in index_of_user and b in index_of_user],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        excluded = sp.csr_matrix(
+            (np.ones(2 * len(requests), dtype=np.int32),
+             (np.concatenate([requests[:, 0], requests[:, 1]]),
+              np.concatenate([requests[:, 1], requests[:, 0]]))),
+            shape=(n, n),
+        )
+
+        degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+        weights = 1.0 / np.log(degrees + 1.0, where=degrees > 0, out=np.ones(n))
+        chunks = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+        init_args = (adjacency, excluded, weights, top_k)
+
+        workers = max(1, options['workers'])
+        if workers == 1:
+            init_worker(*init_args)
+            ranked_chunks = map(rank_chunk, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=init_args)
+            ranked_chunks = pool.imap_unordered(rank_chunk, chunks)
+
+        written = 0
+        try:
+            for ranked in ranked_chunks:
+                replace_stored_suggestions({
+                    user_ids[row]: [(user_ids[col], count, score) for col, count, score in candidates]
+                    for row, candidates in ranked
+                })
+                written += sum(len(candidates) for _, candidates in ranked)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} suggestion(s) for {n} user(s) in "
+            f"{time.monotonic() - started:.1f}s."
+        ))
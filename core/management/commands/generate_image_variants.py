@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.media import build_post_variants, build_profile_variants
+from core.models import Post, UserProfile
+
+
+class Command(BaseCommand):
+    help = "Generate resized image variants for posts and profile pictures that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Regenerate variants even where they already exist.")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(media_kind='image')
+        profiles = UserProfile.objects.exclude(profile_picture='')
+        if not options['all']:
+            posts = posts.filter(image_variants={})
+            profiles = profiles.filter(picture_variants={})
+
+        post_count = profile_count = 0
+        for post in posts.order_by('pk').iterator(chunk_size=100):
+            build_post_variants(post)
+            post_count += 1
+        for profile in profiles.order_by('pk').iterator(chunk_size=100):
+            build_profile_variants(profile)
+            profile_count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {post_count} post image(s) and {profile_count} profile picture(s)."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from core.media import purge_deleted_media, sweep_orphaned_media
+from core.uploads import expire_stale_uploads
+
+
+class Command(BaseCommand):
+    help = ("Delete media files queued for removal and stale chunked uploads, "
+            "optionally sweeping unreferenced files first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--sweep-orphans', action='store_true',
+                            help="Also queue files under MEDIA_ROOT that no Post or UserProfile references.")
+        parser.add_argument('--grace', type=int, default=None,
+                            help="Seconds a file must be old before the sweep treats it as orphaned.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="List orphaned files without deleting anything.")
+
+    def handle(self, *args, **options):
+        if options['sweep_orphans']:
+            orphans = sweep_orphaned_media(grace=options['grace'], dry_run=options['dry_run'])
+            for name in orphans:
+                self.stdout.write(f"Orphaned: {name}")
+        if options['dry_run']:
+            return
+        expired = expire_stale_uploads()
+        if expired:
+            self.stdout.write(f"Discarded {expired} stale video upload(s).")
+        purged = purge_deleted_media(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {purged} file(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import reconcile_post_counters
+
+
+class Command(BaseCommand):
+    help = "Recount likes and comments and repair drifted Post counter columns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_post_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Corrected counters on {fixed} post(s)."))
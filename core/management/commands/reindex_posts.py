@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.post_search import reindex_all
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the post and comment search index, reading rows in primary key "
+        "order a chunk at a time so memory use stays flat on large tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        totals = {'posts': 0, 'comments': 0}
+        for kind, done in reindex_all(chunk_size=options['chunk_size']):
+            totals[kind] = done
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {done} {kind}…")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {totals['posts']} post(s) and {totals['comments']} comment(s)."
+        ))
@@ -0,0 +1,59 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker(burst, sleep, stop_event):
+    # Runs in a child process; with the spawn start method Django has to be
+    # set up again before anything touches the ORM.
+    import django
+    django.setup()
+    from core.jobs import work
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return work(burst=burst, sleep=sleep, should_stop=stop_event.is_set)
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (media processing, timeline fan-out...) from the job queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes to run.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once the queue is empty instead of waiting for more jobs.")
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help="Seconds to wait between polls of an empty queue.")
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        if processes == 1:
+            from core.jobs import work
+            try:
+                count = work(burst=options['burst'], sleep=options['sleep'])
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(self.style.SUCCESS(f"Ran {count} job(s)."))
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        stop_event = multiprocessing.Event()
+        pool = [
+            multiprocessing.Process(
+                target=_worker, args=(options['burst'], options['sleep'], stop_event),
+            )
+            for _ in range(processes)
+        ]
+        for process in pool:
+            process.start()
+        self.stdout.write(f"Started {processes} worker process(es).")
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            for process in pool:
+                process.join()
@@ -0,0 +1,312 @@
+# core/media.py
+#
+# Describes uploaded media once, when it is stored, so templates and APIs can
+# read kind, MIME type and dimensions from Post columns instead of sniffing
+# file names on every render. Also builds the fixed-width image variants that
+# templates offer through srcset.
+
+import json
+import mimetypes
+import shutil
+import subprocess
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import enqueue, is_queued
+from .models import MediaBlob, MediaDeletion, Post, UserProfile
+
+VARIANT_FORMATS = {
+    # format -> (Pillow format name, file extension)
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+VIDEO_MIME_TYPES = {
+    '.mp4': 'video/mp4',
+    '.m4v': 'video/mp4',
+    '.mov': 'video/quicktime',
+    '.webm': 'video/webm',
+    '.ogg': 'video/ogg',
+    '.ogv': 'video/ogg',
+}
+
+
+def _local_path(field_file):
+    """A filesystem path for the file, if one exists without copying it."""
+    upload = getattr(field_file, '_file', None)
+    if hasattr(upload, 'temporary_file_path'):
+        return upload.temporary_file_path()
+    try:
+        return field_file.path
+    except (NotImplementedError, ValueError):
+        return None
+
+
+def probe_image(field_file):
+    """Return (mime, width, height), or None if Pillow can't read it."""
+    try:
+        field_file.open('rb')
+    except OSError:
+        return None
+    try:
+        with Image.open(field_file) as image:
+            mime = Image.MIME.get(image.format, '')
+            width, height = image.size
+    except (UnidentifiedImageError, OSError):
+        return None
+    finally:
+        field_file.seek(0)
+    return mime, width, height
+
+
+def probe_video(field_file):
+    """
+    Return (mime, width, height, duration) for a video. Dimensions and
+    duration come from ffprobe when it is installed and the file has a local
+    path; otherwise only the MIME type is known.
+    """
+    suffix = Path(field_file.name).suffix.lower()
+    mime = VIDEO_MIME_TYPES.get(suffix) or mimetypes.guess_type(field_file.name)[0] or ''
+    width = height = duration = None
+
+    path = _local_path(field_file)
+    ffprobe = shutil.which('ffprobe')
+    if path and ffprobe:
+        try:
+            result = subprocess.run(
+                [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                 '-show_entries', 'stream=width,height:format=duration',
+                 '-of', 'json', path],
+                capture_output=True, check=True, timeout=30,
+            )
+            info = json.loads(result.stdout)
+            stream = (info.get('streams') or [{}])[0]
+            width, height = stream.get('width'), stream.get('height')
+            if info.get('format', {}).get('duration'):
+                duration = float(info['format']['duration'])
+        except (subprocess.SubprocessError, ValueError, OSError):
+            pass
+    return mime, width, height, duration
+
+
+def describe_media(post):
+    """Fill post's media_* fields from its image or video."""
+    post.media_width = post.media_height = post.media_duration = None
+    post.media_mime = ''
+
+    if post.image:
+        probed = probe_image(post.image)
+        if probed:
+            post.media_kind = 'image'
+            post.media_mime, post.media_width, post.media_height = probed
+        else:
+            post.media_kind = 'unknown'
+    elif post.video:
+        mime, width, height, duration = probe_video(post.video)
+        post.media_kind = 'video' if mime.startswith('video/') else 'unknown'
+        post.media_mime = mime
+        post.media_width, post.media_height, post.media_duration = width, height, duration
+    else:
+        post.media_kind = 'none'
+    return post
+
+
+def _encode(image, fmt):
+    pil_format, _ = VARIANT_FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(field_file, widths=None, formats=None):
+    """
+    Write resized copies of an image next to it in the same storage and
+    return their storage keys as {format: {width: key}}. Widths wider than
+    the source are skipped, except that the narrowest is always produced.
+    Returns {} if the file can't be read as an image.
+    """
+    widths = sorted(widths or settings.IMAGE_VARIANT_WIDTHS)
+    formats = formats or settings.IMAGE_VARIANT_FORMATS
+    storage = field_file.storage
+    stem = Path(field_file.name).with_suffix('').as_posix()
+
+    try:
+        field_file.open('rb')
+        with Image.open(field_file) as source:
+            source = ImageOps.exif_transpose(source)
+            source.load()
+    except (UnidentifiedImageError, OSError):
+        return {}
+    finally:
+        field_file.close()
+
+    variants = {fmt: {} for fmt in formats}
+    for width in widths:
+        if width > source.width and width != widths[0]:
+            break
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            key = f"variants/{stem}_{width}.{VARIANT_FORMATS[fmt][1]}"
+            key = storage.save(key, ContentFile(_encode(resized, fmt)))
+            variants[fmt][str(width)] = key
+    return variants
+
+
+def variant_names(variants):
+    return [key for keys in (variants or {}).values() for key in keys.values()]
+
+
+def _schedule_purge():
+    if not is_queued('purge_media'):
+        enqueue('purge_media', delay=settings.MEDIA_PURGE_DELAY)
+
+
+def schedule_deletion(names):
+    """
+    Queue storage names for removal. Nothing touches the filesystem here;
+    a purge job is scheduled for after the transaction commits.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    MediaDeletion.objects.bulk_create([MediaDeletion(name=name) for name in names])
+    transaction.on_commit(_schedule_purge)
+
+
+def purge_deleted_media(batch_size=None, storage=default_storage):
+    """Delete queued files batch by batch. Returns how many were removed."""
+    batch_size = batch_size or settings.MEDIA_PURGE_BATCH_SIZE
+    purged = 0
+    while True:
+        batch = list(MediaDeletion.objects.order_by('pk').values_list('pk', 'name')[:batch_size])
+        if not batch:
+            return purged
+        for _, name in batch:
+            storage.delete(name)
+        MediaDeletion.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+        purged += len(batch)
+
+
+def referenced_media():
+    """
+    Count how many times each storage name is referenced by a Post or
+    UserProfile. Returns a Counter.
+    """
+    names = Counter()
+    for image, video, variants in Post.objects.values_list(
+            'image', 'video', 'image_variants').iterator(chunk_size=2000):
+        names.update(name for name in (image, video, *variant_names(variants)) if name)
+    for picture, variants in UserProfile.objects.values_list(
+            'profile_picture', 'picture_variants').iterator(chunk_size=2000):
+        names.update(name for name in (picture, *variant_names(variants)) if name)
+    names[UserProfile._meta.get_field('profile_picture').default] += 1
+    return names
+
+
+def reconcile_blob_refcounts(expected, cutoff):
+    """
+    Reset MediaBlob.refcount to `expected` (a Counter) for blobs created
+    before cutoff, so leaked references from rolled-back uploads don't keep
+    a blob alive forever. Returns the number of blobs corrected.
+    """
+    drifted = []
+    for blob in MediaBlob.objects.filter(created_at__lt=cutoff).only('pk', 'name', 'refcount').iterator():
+        if blob.refcount != expected[blob.name]:
+            blob.refcount = expected[blob.name]
+            drifted.append(blob)
+    MediaBlob.objects.bulk_update(drifted, ['refcount'], batch_size=1000)
+    return len(drifted)
+
+
+def _walk(storage, path=''):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield f"{path}/{name}" if path else name
+    for directory in directories:
+        yield from _walk(storage, f"{path}/{directory}" if path else directory)
+
+
+def sweep_orphaned_media(grace=None, storage=default_storage, dry_run=False):
+    """
+    Queue for deletion every file under the media root that nothing
+    references and that is older than the grace period, and bring blob
+    reference counts back in line with the references that exist. Returns
+    the orphaned names; with dry_run nothing is changed.
+    """
+    grace = settings.MEDIA_ORPHAN_GRACE if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    referenced = referenced_media()
+    pending = Counter(MediaDeletion.objects.values_list('name', flat=True))
+    orphans = [
+        name for name in _walk(storage)
+        if not referenced[name] and not pending[name]
+        and not name.startswith('tmp/uploads/')
+        and storage.get_modified_time(name) < cutoff
+    ]
+    if not dry_run:
+        # Every reference, queued deletion and about-to-be-queued orphan
+        # will release the blob exactly once.
+        reconcile_blob_refcounts(referenced + pending + Counter(orphans), cutoff)
+        schedule_deletion(orphans)
+    return orphans
+
+
+def strip_metadata(field_file):
+    """
+    Re-encode an image without its EXIF block (GPS position, camera serial
+    numbers...), applying the EXIF orientation first so nothing turns
+    sideways. The clean copy replaces the original in storage and
+    field_file.name is updated; returns True if the file was rewritten.
+    Animated images and images without EXIF are left alone.
+    """
+    try:
+        field_file.open('rb')
+        with Image.open(field_file) as image:
+            if getattr(image, 'is_animated', False) or not image.getexif():
+                return False
+            pil_format = image.format
+            icc_profile = image.info.get('icc_profile')
+            clean = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError):
+        return False
+    finally:
+        field_file.close()
+
+    buffer = BytesIO()
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if pil_format == 'JPEG':
+        options['quality'] = 95
+    clean.save(buffer, pil_format, **options)
+
+    storage = field_file.storage
+    old_name = field_file.name
+    field_file.name = storage.save(old_name, ContentFile(buffer.getvalue()))
+    field_file.file = None  # drop the handle on the old file; reopen by name
+    storage.delete(old_name)
+    return True
+
+
+def build_post_variants(post):
+    if post.media_kind != 'image' or not post.image:
+        return
+    schedule_deletion(variant_names(post.image_variants))
+    post.image_variants = generate_variants(post.image)
+    post.save(update_fields=['image_variants'])
+
+
+def build_profile_variants(profile):
+    schedule_deletion(variant_names(profile.picture_variants))
+    profile.picture_variants = generate_variants(profile.profile_picture) if profile.profile_picture else {}
+    profile.save(update_fields=['picture_variants'])
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def merge_likes(apps, schema_editor):
+    """
+    Copy every Post.likes M2M row into Like (keeping existing Like rows and
+    their timestamps), then recount like_count from the merged store.
+    """
+    Post = apps.get_model('core', 'Post')
+    Like = apps.get_model('core', 'Like')
+    Through = Post.likes.through
+
+    rows = Through.objects.values_list('customuser_id', 'post_id').iterator(chunk_size=2000)
+    batch = []
+    for user_id, post_id in rows:
+        batch.append(Like(user_id=user_id, post_id=post_id))
+        if len(batch) >= 2000:
+            Like.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    Like.objects.bulk_create(batch, ignore_conflicts=True)
+
+    likes = Like.objects.filter(post=OuterRef('pk')).order_by()
+    Post.objects.update(
+        like_count=Coalesce(Subquery(likes.values('post').annotate(n=Count('*')).values('n')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_post_like_count_comment_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_likes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='post',
+            name='likes',
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='post',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='core.post'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_friend_count(apps, schema_editor):
+    UserProfile = apps.get_model('core', 'UserProfile')
+    rows = UserProfile.friends.through.objects.filter(from_userprofile=OuterRef('pk')).order_by()
+    UserProfile.objects.update(
+        friend_count=Coalesce(Subquery(
+            rows.values('from_userprofile').annotate(n=Count('*')).values('n')
+        ), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='friend_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_id_idx'),
+        ),
+        migrations.RunPython(populate_friend_count, migrations.RunPython.noop),
+    ]
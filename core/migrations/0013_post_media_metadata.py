@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+def guess_media_kind(apps, schema_editor):
+    # Templates pick the image or video markup by media_kind, so existing
+    # posts need it before they are described. Which file is set is enough
+    # for that; `manage.py backfill_media_metadata` fills in the rest later
+    # (media_mime is left empty, which is what it looks for).
+    Post = apps.get_model('core', 'Post')
+    Post.objects.exclude(image='').exclude(image=None).update(media_kind='image')
+    Post.objects.filter(media_kind='none').exclude(video='').exclude(video=None).update(media_kind='video')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_userprofile_friend_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='media_duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='media_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='media_kind',
+            field=models.CharField(choices=[('none', 'No media'), ('image', 'Image'), ('video', 'Video'), ('unknown', 'Unknown')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='media_mime',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='media_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(guess_media_kind, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_users(apps, schema_editor):
+    from core.search import user_terms
+
+    User = apps.get_model('core', 'CustomUser')
+    UserSearchTerm = apps.get_model('core', 'UserSearchTerm')
+    batch = []
+    for user in User.objects.only('pk', 'username', 'first_name', 'last_name').iterator():
+        batch += [UserSearchTerm(user_id=user.pk, term=term, weight=weight)
+                  for term, weight in user_terms(user).items()]
+        if len(batch) >= 1000:
+            UserSearchTerm.objects.bulk_create(batch)
+            batch = []
+    UserSearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_friendsuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('term', 'user')},
+            },
+        ),
+        migrations.RunPython(index_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def seed_timelines(apps, schema_editor):
+    # Timelines are only written on fan-out, so without this every existing
+    # user's feed would stay empty until `manage.py rebuild_timelines` ran.
+    # Mirrors core.timeline.rebuild_timeline on the historical models.
+    Post = apps.get_model('core', 'Post')
+    TimelineEntry = apps.get_model('core', 'TimelineEntry')
+    UserProfile = apps.get_model('core', 'UserProfile')
+    Friendship = UserProfile.friends.through
+
+    max_length = settings.TIMELINE_MAX_LENGTH
+    fan_out_limit = settings.TIMELINE_FANOUT_MAX_FRIENDS
+    for user_id in UserProfile.objects.values_list('user_id', flat=True).iterator():
+        authors = [user_id, *Friendship.objects.filter(
+            from_userprofile__user_id=user_id,
+            to_userprofile__friend_count__lte=fan_out_limit,
+        ).values_list('to_userprofile__user_id', flat=True)]
+        recent = (
+            Post.objects.filter(user_id__in=authors)
+            .order_by('-created_at', '-id')
+            .values_list('pk', 'created_at')[:max_length]
+        )
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post_id=pk, created_at=created_at)
+            for pk, created_at in recent
+        ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_postsearchterm'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_timelines, migrations.RunPython.noop),
+    ]
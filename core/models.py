@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -30,23 +32,44 @@ class UserProfile(models.Model):
     bio = models.TextField(blank=True)
     location = models.CharField(max_length=100, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', default='default.jpg')
+    # Resized copies of profile_picture, {format: {width: storage key}}.
+    picture_variants = models.JSONField(default=dict, blank=True)
     # Use a self-referential ManyToManyField to represent established friendships.
     friends = models.ManyToManyField("self", symmetrical=True, blank=True)
+    # Denormalized degree, recounted from the signal on friends changes.
+    friend_count = models.PositiveIntegerField(default=0)
 
     def get_mutual_friends(self, other_profile):
         """
         Return a QuerySet of mutual friends between this profile and another.
         other_profile should be another UserProfile instance.
         """
-        # Get the IDs of the other profile's friends.
-        other_friends_ids = other_profile.friends.all().values_list('id', flat=True)
-        # Filter this profile's friends to those that are also in the other profile.
-        return self.friends.filter(id__in=other_friends_ids)
+        from .friend_graph import mutual_friend_ids
+
+        # The intersection comes from the cached friend graph; only the
+        # resulting profiles are read from the database.
+        mutual = mutual_friend_ids(self.user_id, other_profile.user_id)
+        return UserProfile.objects.filter(user_id__in=mutual)
 
     def __str__(self):
         return self.user.username
 
 
+MEDIA_KIND_CHOICES = [
+    ('none', 'No media'),
+    ('image', 'Image'),
+    ('video', 'Video'),
+    ('unknown', 'Unknown'),
+]
+
+
+MEDIA_STATUS_CHOICES = [
+    ('pending', 'Processing'),
+    ('ready', 'Ready'),
+    ('failed', 'Failed'),
+]
+
+
 # Post model with support for text content, images, videos, likes, and comments.
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -54,14 +77,36 @@ class Post(models.Model):
     image = models.ImageField(upload_to='post_images/', blank=True, null=True)
     video = models.FileField(upload_to='post_videos/', blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
-    # ManyToMany field to store users who liked the post.
-    likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    # Described once at upload time by core.media so nothing has to sniff
+    # the file on render.
+    media_kind = models.CharField(max_length=10, choices=MEDIA_KIND_CHOICES, default='none')
+    media_mime = models.CharField(max_length=100, blank=True)
+    media_width = models.PositiveIntegerField(null=True, blank=True)
+    media_height = models.PositiveIntegerField(null=True, blank=True)
+    media_duration = models.FloatField(null=True, blank=True)  # seconds, videos only
+    # Resized copies of image, {format: {width: storage key}}.
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Uploads are processed by a background job; until it finishes the
+    # feed shows a placeholder instead of the media.
+    media_status = models.CharField(max_length=10, choices=MEDIA_STATUS_CHOICES, default='ready')
+    # Denormalized counters, kept in step by core.counters so rendering a
+    # post never has to COUNT(*) the likes or comments tables.
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Backs keyset pagination of the feed on (created_at, id).
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # Per-author recent posts, merged into feeds at read time.
+            models.Index(fields=['user', '-created_at', '-id'], name='post_user_created_id_idx'),
+        ]
 
     def total_likes(self):
-        return self.likes.count()
+        return self.like_count
 
     def total_comments(self):
-        return self.comment_set.count()
+        return self.comment_count
 
     def __str__(self):
         return f"Post by {self.user.username}"
@@ -78,10 +123,10 @@ class Comment(models.Model):
         return f"Comment by {self.user.username} on Post {self.post.id}"
 
 
-# Optional Like model if you want audit/metadata in addition to the ManyToMany "likes" on Post.
+# The single store of likes; read and write it through core.likes.
 class Like(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -106,3 +151,155 @@ class FriendRequest(models.Model):
         return f"{self.sender.username} → {self.receiver.username}"
 
 
+
+
+# One row per (timeline owner, post): the materialized home feed. Rows are
+# written by core.timeline when a post is fanned out, and created_at is a copy
+# of the post's so a page is a single range read on the owner's index.
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='timeline_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in {self.user_id}'s timeline"
+
+
+# Friend suggestions precomputed by `manage.py build_friend_suggestions`;
+# core.suggestions reads them on a cache miss and drops a user's rows when
+# their friendships change.
+class FriendSuggestion(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    mutual_count = models.PositiveIntegerField()
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', 'rank'], name='suggestion_user_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} → {self.suggested} ({self.mutual_count} mutual)"
+
+
+# A unit of background work, run by `manage.py run_worker` (see core.jobs).
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+# Media files waiting to be removed from storage. Deleting a post or profile
+# only appends rows here; core.media.purge_deleted_media removes the files in
+# batches from a background job or `manage.py purge_media`.
+class MediaDeletion(models.Model):
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+# Reference counts for files kept by core.storage.ContentAddressedStorage.
+# One row per stored blob; the file is removed when refcount reaches zero.
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
+
+# A resumable, chunked video upload (core.uploads). Chunks are appended to a
+# temp file under MEDIA_ROOT/tmp/uploads; `received` is the resume offset.
+class VideoUpload(models.Model):
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    post = models.OneToOneField(Post, null=True, blank=True, on_delete=models.SET_NULL,
+                                related_name='video_upload')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+# Inverted index behind user search (core.search): one row per distinct term
+# in a user's username and names. The unique index on (term, user) is what
+# prefix lookups range-scan.
+class UserSearchTerm(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'user')
+
+    def __str__(self):
+        return f"{self.term} → {self.user_id}"
+
+
+# Inverted index behind post search (core.post_search): one row per distinct
+# term in a document, where a document is a post's content (comment is null)
+# or one comment on the post. positions are the term's word offsets in the
+# document, which phrase queries check for adjacency.
+class PostSearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True,
+                                related_name='+')
+    positions = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [models.Index(fields=['term', 'post'], name='post_search_term_idx')]
+
+    def __str__(self):
+        return f"{self.term} → post {self.post_id}"
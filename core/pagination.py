@@ -0,0 +1,71 @@
+# core/pagination.py
+
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """
+    Turn the (created_at, id) sort key of the last row on a page into an
+    opaque, URL-safe token.
+    """
+    raw = json.dumps([created_at.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Reverse encode_cursor(). Raises InvalidCursor for anything that was not
+    produced by it.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if created_at is None:
+        raise InvalidCursor(token)
+    return created_at, pk
+
+
+def get_page_size(request, default=None, maximum=None):
+    """
+    Read ?page_size= from the request, clamped to FEED_MAX_PAGE_SIZE.
+    """
+    default = default or settings.FEED_PAGE_SIZE
+    maximum = maximum or settings.FEED_MAX_PAGE_SIZE
+    try:
+        size = int(request.GET.get('page_size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+def after_key(queryset, key, time_field='created_at', id_field='id'):
+    """Restrict queryset to rows that sort strictly after key, newest first."""
+    created_at, pk = key
+    return queryset.filter(
+        Q(**{f'{time_field}__lt': created_at}) |
+        Q(**{time_field: created_at, f'{id_field}__lt': pk})
+    )
+
+
+def cut_page(keys, page_size):
+    """
+    Split up to page_size + 1 (created_at, id) sort keys, newest first, into
+    the page and the cursor for the next one (None on the last page).
+    """
+    if len(keys) <= page_size:
+        return keys, None
+    keys = keys[:page_size]
+    return keys, encode_cursor(*keys[-1])
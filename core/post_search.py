@@ -0,0 +1,205 @@
+# core/post_search.py
+#
+# Full-text search over post content and comments, on the same kind of
+# database-backed inverted index as user search (core.search). Each post's
+# content and each comment is a document whose terms are stored in
+# PostSearchTerm with their word positions; the signals in core.signals
+# re-index a document when it is saved, and the rows cascade away with it.
+#
+# Queries are words, "quoted phrases" and prefixes (pho*); every part has
+# to match somewhere in the post or its comments, a phrase within a single
+# document. Terms are matched in SQL, phrases are then checked against the
+# stored positions. Results are the viewer's own and friends' posts (the
+# user_profile visibility rule), newest first, with a keyset cursor.
+
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .friend_graph import db_friend_ids
+from .models import Comment, Post, PostSearchTerm
+from .pagination import after_key, cut_page, decode_cursor
+from .search import prefix_range, tokenize
+
+QUERY_RE = re.compile(r'"([^"]*)"?|(\S+)')
+# Shorter prefixes match so many terms that they are looked up exactly.
+MIN_PREFIX_LENGTH = 2
+# Candidate posts fetched per round while checking phrases.
+SCAN_BATCH_SIZE = 200
+
+
+def document_terms(text):
+    """{term: [positions]} for one document."""
+    positions = defaultdict(list)
+    for position, term in enumerate(tokenize(text)):
+        positions[term].append(position)
+    return positions
+
+
+def _rows(post_id, comment_id, text):
+    return [
+        PostSearchTerm(post_id=post_id, comment_id=comment_id, term=term, positions=positions)
+        for term, positions in document_terms(text).items()
+    ]
+
+
+def index_post(post):
+    """Replace the terms of post's content in the index."""
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(post_id=post.pk, comment=None).delete()
+        PostSearchTerm.objects.bulk_create(_rows(post.pk, None, post.content))
+
+
+def index_comment(comment):
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(comment_id=comment.pk).delete()
+        PostSearchTerm.objects.bulk_create(_rows(comment.post_id, comment.pk, comment.text))
+
+
+def reindex_posts(posts):
+    """Re-index (pk, content) pairs in one transaction."""
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(post_id__in=[pk for pk, _ in posts], comment=None).delete()
+        PostSearchTerm.objects.bulk_create(
+            [row for pk, content in posts for row in _rows(pk, None, content)],
+            batch_size=1000,
+        )
+
+
+def reindex_comments(comments):
+    """Re-index (pk, post_id, text) triples in one transaction."""
+    with transaction.atomic():
+        PostSearchTerm.objects.filter(comment_id__in=[pk for pk, _, _ in comments]).delete()
+        PostSearchTerm.objects.bulk_create(
+            [row for pk, post_id, text in comments for row in _rows(post_id, pk, text)],
+            batch_size=1000,
+        )
+
+
+def parse_query(query):
+    """
+    Split a query into (tokens, prefix) clauses: one per bare word or quoted
+    phrase, prefix set when it ends in '*'. A bare word that tokenizes into
+    several tokens ("don't", "e-mail") is a phrase too.
+    """
+    clauses = []
+    for phrase, word in QUERY_RE.findall(query or ''):
+        text = phrase or word
+        tokens = tuple(tokenize(text))
+        if tokens:
+            prefix = text.rstrip().endswith('*') and len(tokens[-1]) >= MIN_PREFIX_LENGTH
+            clauses.append((tokens, prefix))
+    return clauses[:settings.POST_SEARCH_MAX_TERMS]
+
+
+def _term_q(token, prefix):
+    return prefix_range(token) if prefix else Q(term=token)
+
+
+def _clause_terms(clause):
+    tokens, prefix = clause
+    return [(token, prefix and i == len(tokens) - 1) for i, token in enumerate(tokens)]
+
+
+def _phrase_at(terms, clause):
+    """Whether a document ({term: positions}) contains the phrase clause."""
+    wanted = []
+    for token, is_prefix in _clause_terms(clause):
+        if is_prefix:
+            found = {p for term, ps in terms.items() if term.startswith(token) for p in ps}
+        else:
+            found = set(terms.get(token, ()))
+        if not found:
+            return False
+        wanted.append(found)
+    return any(
+        all(start + i in positions for i, positions in enumerate(wanted[1:], 1))
+        for start in wanted[0]
+    )
+
+
+def _with_phrases(post_ids, phrases):
+    """The subset of post_ids in which every phrase occurs in one document."""
+    match = Q()
+    for clause in phrases:
+        for token, is_prefix in _clause_terms(clause):
+            match |= _term_q(token, is_prefix)
+    documents = defaultdict(dict)
+    rows = PostSearchTerm.objects.filter(match, post_id__in=post_ids).values_list(
+        'post_id', 'comment_id', 'term', 'positions',
+    )
+    for post_id, comment_id, term, positions in rows:
+        documents[post_id, comment_id][term] = positions
+
+    found = defaultdict(set)
+    for (post_id, _), terms in documents.items():
+        for i, clause in enumerate(phrases):
+            if i not in found[post_id] and _phrase_at(terms, clause):
+                found[post_id].add(i)
+    return {post_id for post_id, matched in found.items() if len(matched) == len(phrases)}
+
+
+def search_posts(viewer, query, cursor=None, page_size=20):
+    """
+    One page of posts visible to viewer that match query, newest first.
+    Returns (posts, next_cursor). Raises InvalidCursor on a bad cursor.
+    """
+    clauses = parse_query(query)
+    if not clauses:
+        return [], None
+    key = decode_cursor(cursor) if cursor else None
+
+    candidates = Post.objects.filter(Q(user_id=viewer.pk) | Q(user_id__in=db_friend_ids(viewer.pk)))
+    for clause in clauses:
+        for token, is_prefix in _clause_terms(clause):
+            candidates = candidates.filter(
+                pk__in=PostSearchTerm.objects.filter(_term_q(token, is_prefix)).values('post_id')
+            )
+    candidates = candidates.order_by('-created_at', '-id')
+    phrases = [clause for clause in clauses if len(clause[0]) > 1]
+
+    # Every term is present in the candidates; phrases still have to be
+    # checked, so read them in batches until the page (plus one, to know
+    # whether there is a next page) is full.
+    keys = []
+    batch_size = max(page_size + 1, SCAN_BATCH_SIZE) if phrases else page_size + 1
+    while len(keys) <= page_size:
+        batch = candidates if key is None else after_key(candidates, key)
+        batch = list(batch.values_list('created_at', 'id')[:batch_size])
+        matched = _with_phrases([pk for _, pk in batch], phrases) if phrases else None
+        keys += [k for k in batch if matched is None or k[1] in matched]
+        if len(batch) < batch_size:
+            break
+        key = batch[-1]
+
+    keys, next_cursor = cut_page(keys, page_size)
+    by_id = Post.objects.select_related('user', 'user__userprofile').in_bulk(
+        [pk for _, pk in keys]
+    )
+    return [by_id[pk] for _, pk in keys if pk in by_id], next_cursor
+
+
+def reindex_all(chunk_size=500):
+    """
+    Rebuild the whole index, reading posts and then comments in primary key
+    order chunk_size rows at a time. Yields (kind, documents indexed so far)
+    after each chunk.
+    """
+    for kind, queryset, fields, reindex in (
+        ('posts', Post.objects.all(), ('pk', 'content'), reindex_posts),
+        ('comments', Comment.objects.all(), ('pk', 'post_id', 'text'), reindex_comments),
+    ):
+        last, done = 0, 0
+        while True:
+            chunk = list(
+                queryset.filter(pk__gt=last).order_by('pk').values_list(*fields)[:chunk_size]
+            )
+            if not chunk:
+                break
+            reindex(chunk)
+            last = chunk[-1][0]
+            done += len(chunk)
+            yield kind, done
@@ -0,0 +1,98 @@
+# core/search.py
+#
+# A small inverted index for user search, kept in the database so it works
+# on every backend (SQLite's FTS5 would only help locally). Each user's
+# username and names are split into lower-cased, accent-folded terms stored
+# in UserSearchTerm; a query is split the same way and every query term has
+# to prefix-match one of the user's terms. Prefix matches are index range
+# scans (term >= 'ab' AND term < 'ab\uffff'), never LIKE '%...%' scans.
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Value, When
+
+from .models import UserSearchTerm
+
+TERM_MAX_LENGTH = 64
+TOKEN_RE = re.compile(r'\w+')
+
+# Score per matching term, by where it came from; an exact (not prefix)
+# match counts double.
+FIELD_WEIGHTS = {
+    'username': 3,
+    'first_name': 2,
+    'last_name': 2,
+}
+
+
+def fold(text):
+    """Lower-case text and strip accents, so 'José' matches 'jose'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Lower-cased, accent-free word tokens; underscores split words too."""
+    return [
+        token[:TERM_MAX_LENGTH]
+        for token in TOKEN_RE.findall(fold(text).replace('_', ' '))
+    ]
+
+
+def prefix_range(token, field='term'):
+    return Q(**{f'{field}__gte': token, f'{field}__lt': token + '\uffff'})
+
+
+def user_terms(user):
+    """{term: weight} for a user; a term found in several fields keeps the best weight."""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(getattr(user, field, '')):
+            terms[term] = max(weight, terms.get(term, 0))
+    return terms
+
+
+def index_user(user):
+    """Replace user's terms in the index."""
+    with transaction.atomic():
+        UserSearchTerm.objects.filter(user_id=user.pk).delete()
+        UserSearchTerm.objects.bulk_create([
+            UserSearchTerm(user_id=user.pk, term=term, weight=weight)
+            for term, weight in user_terms(user).items()
+        ])
+
+
+def search_user_ids(query, limit=None):
+    """
+    Ids of users matching every term of query, best first, at most limit
+    (USER_SEARCH_MAX_RESULTS) of them. One grouped query over the index.
+    """
+    limit = limit or settings.USER_SEARCH_MAX_RESULTS
+    tokens = list(dict.fromkeys(tokenize(query)))[:settings.USER_SEARCH_MAX_TERMS]
+    if not tokens:
+        return []
+
+    matches = Q()
+    scores = {}
+    for i, token in enumerate(tokens):
+        matches |= prefix_range(token)
+        scores[f'match_{i}'] = Max(Case(
+            When(term=token, then=F('weight') * 2),
+            When(prefix_range(token), then=F('weight')),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+    ranked = (
+        UserSearchTerm.objects.filter(matches)
+        .values('user_id')
+        .annotate(**scores)
+        .filter(**{f'{name}__gt': 0 for name in scores})
+        .annotate(score=sum((F(name) for name in scores), Value(0)))
+        .order_by('-score', 'user__username')
+        .values_list('user_id', flat=True)[:limit]
+    )
+    return list(ranked)
@@ -0,0 +1,155 @@
+# core/serving.py
+#
+# Serves MEDIA_URL in place of django.conf.urls.static, which reads whole
+# files through Python and sends no caching headers. serve_media answers
+# conditional requests (ETag / Last-Modified) with 304, supports single
+# byte ranges so <video> can seek, and marks content-addressed blobs as
+# immutable. With MEDIA_ACCEL_REDIRECT or MEDIA_SENDFILE_HEADER set, the
+# response body is left to the front-end server (nginx X-Accel-Redirect,
+# Apache/lighttpd X-Sendfile), which then also handles ranges itself.
+
+import mimetypes
+import os
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import is_blob
+
+# Directories under MEDIA_ROOT whose files are never served.
+PRIVATE_DIRS = ('tmp',)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def file_etag(path, stat):
+    """Blobs are named by their SHA-256, which makes a perfect strong ETag."""
+    if is_blob(path):
+        return f'"{Path(path).stem}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range Range header into (start, end) inclusive. Returns
+    None to serve the whole file (no header, or one we don't handle such as
+    multiple ranges) and raises ValueError if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) <= date
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+@require_safe
+def serve_media(request, path):
+    full_path = safe_join(settings.MEDIA_ROOT, path.lstrip('/'))
+    # Checked on the resolved path, so 'a/../tmp/x' or './tmp/x' can't slip
+    # past; path is from here on the normalized one.
+    path = Path(os.path.relpath(full_path, safe_join(settings.MEDIA_ROOT))).as_posix()
+    if path.split('/', 1)[0] in PRIVATE_DIRS:
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = file_etag(path, stat)
+    last_modified = int(stat.st_mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _with_headers(not_modified, path, etag, last_modified)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    size = stat.st_size
+
+    if settings.MEDIA_ACCEL_REDIRECT or settings.MEDIA_SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.MEDIA_ACCEL_REDIRECT:
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + quote(path)
+        else:
+            response[settings.MEDIA_SENDFILE_HEADER] = full_path
+        return _with_headers(response, path, etag, last_modified)
+
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _with_headers(response, path, etag, last_modified)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif byte_range is None:
+        # FileResponse hands the open file to wsgi.file_wrapper, which
+        # servers such as gunicorn turn into sendfile().
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, length), status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return _with_headers(response, path, etag, last_modified)
+
+
+def _with_headers(response, path, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = (
+        IMMUTABLE if is_blob(path) else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+    return response
@@ -0,0 +1,45 @@
+# core/sidebar.py
+#
+# The friends list shown in every page's sidebar, cached per user in the
+# SIDEBAR_CACHE cache. Entries are keyed by a per-user version number; a
+# friendship change or a friend's rename bumps the version instead of
+# hunting down keys, and the orphaned entries simply expire.
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .caching import bump_versions, get_cache, get_or_compute, versioned_key
+from .friend_graph import friend_ids
+
+User = get_user_model()
+
+
+def sidebar_cache():
+    return get_cache(settings.SIDEBAR_CACHE)
+
+
+def sidebar_friends(user_id):
+    """[{'user_id', 'username'}, ...] for user_id's friends, by username."""
+    cache = sidebar_cache()
+
+    def load():
+        return [
+            {'user_id': pk, 'username': username}
+            for pk, username in User.objects.filter(pk__in=list(friend_ids(user_id)))
+            .order_by('username').values_list('pk', 'username')
+        ]
+
+    return get_or_compute(
+        cache, versioned_key(cache, f'sidebar:{user_id}'), load, settings.SIDEBAR_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_sidebars(user_ids):
+    """
+    Bump the users' sidebar versions once the current transaction commits;
+    bumped any earlier, a concurrent request could cache the old list under
+    the new version.
+    """
+    namespaces = [f'sidebar:{user_id}' for user_id in user_ids]
+    transaction.on_commit(lambda: bump_versions(sidebar_cache(), namespaces))
@@ -1,20 +1,44 @@
 # signals.py
+import threading
+
 from django.apps import apps
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-from .models import UserProfile
+from .models import Comment, FriendRequest, Post, UserProfile
+from .counters import adjust_comment_count, recount_friends, release_user_comments
+from .fragments import invalidate_author_cards, invalidate_post_cards
+from .friend_graph import forget, friend_ids, record_change
+from .jobs import enqueue
+from .likes import forget_user
+from .media import schedule_deletion, variant_names
+from .post_search import index_comment, index_post
+from . import typeahead
+from .search import index_user
+from .sidebar import invalidate_sidebars
+from .suggestions import invalidate_suggestions
+from .timeline import high_degree_user_ids
 
 
 @receiver(post_delete, sender=apps.get_model('core', 'Post'))
 def delete_post_media(sender, instance, **kwargs):
-    if instance.image:
-        instance.image.delete(False)
-    if instance.video:
-        instance.video.delete(False)
+    # Files are only queued here; a purge job removes them in batches.
+    schedule_deletion([
+        instance.image.name,
+        instance.video.name,
+        *variant_names(instance.image_variants),
+    ])
+
+
+@receiver(post_delete, sender=UserProfile)
+def delete_profile_media(sender, instance, **kwargs):
+    picture = instance.profile_picture.name
+    if picture == UserProfile._meta.get_field('profile_picture').default:
+        picture = None
+    schedule_deletion([picture, *variant_names(instance.picture_variants)])
 
 # core/signals.py
 
@@ -24,4 +48,188 @@ from django.conf import settings
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+        forget([instance.pk])
+
+
+
+# Keep Post.comment_count in step with the rows it counts. Likes are
+# counted by core.likes, which owns every like write.
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def release_user_likes(sender, instance, **kwargs):
+    forget_user(instance)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, **kwargs):
+    if created:
+        adjust_comment_count(instance.post_id, 1)
+
+
+# Comments cascaded away with their post or their author are accounted for
+# once, in bulk, when that delete starts, not by one UPDATE and one card
+# invalidation per comment.
+_cascade = threading.local()
+
+
+def _deleting(kind):
+    if not hasattr(_cascade, kind):
+        setattr(_cascade, kind, set())
+    return getattr(_cascade, kind)
+
+
+def _cascaded(comment):
+    return comment.post_id in _deleting('posts') or comment.user_id in _deleting('users')
+
+
+@receiver(pre_delete, sender=Post)
+def start_post_cascade(sender, instance, **kwargs):
+    _deleting('posts').add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def end_post_cascade(sender, instance, **kwargs):
+    _deleting('posts').discard(instance.pk)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def release_comments_of_deleted_user(sender, instance, **kwargs):
+    _deleting('users').add(instance.pk)
+    invalidate_post_cards(release_user_comments(instance.pk))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def end_user_cascade(sender, instance, **kwargs):
+    _deleting('users').discard(instance.pk)
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_count(sender, instance, **kwargs):
+    if not _cascaded(instance):
+        adjust_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def index_post_for_search(sender, instance, created, update_fields=None, **kwargs):
+    # Media processing and counters save other columns only.
+    if created or not update_fields or 'content' in update_fields:
+        index_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if created or not update_fields or 'text' in update_fields:
+        index_comment(instance)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post_card(sender, instance, **kwargs):
+    invalidate_post_cards([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post_card(sender, instance, **kwargs):
+    if not _cascaded(instance):
+        invalidate_post_cards([instance.post_id])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_post_cards(sender, instance, created, update_fields=None, **kwargs):
+    # Cards show the author's username, and profile cards the username of
+    # each commenter; logins only touch last_login.
+    if not created and not (update_fields and set(update_fields) <= {'last_login'}):
+        invalidate_author_cards([instance.pk])
+        invalidate_post_cards(
+            Comment.objects.filter(user=instance).values_list('post_id', flat=True).distinct()
+        )
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_pictured_post_cards(sender, instance, created, **kwargs):
+    # Cards show the author's profile picture too.
+    if not created:
+        invalidate_author_cards([instance.user_id])
+
+
+def _recount_friends(profile_ids):
+    # Authors who drop back under the fan-out limit leave the read-time
+    # merge, so their recent posts have to go into their friends' timelines.
+    was_high_degree = high_degree_user_ids(profile_ids)
+    recount_friends(profile_ids)
+    if was_high_degree:
+        for user_id in was_high_degree - high_degree_user_ids(profile_ids):
+            enqueue('backfill_author', author_id=user_id)
+
+
+@receiver(m2m_changed, sender=UserProfile.friends.through)
+def update_friend_count(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_friend_ids = list(instance.friends.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        _recount_friends([instance.pk, *getattr(instance, '_cleared_friend_ids', [])])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        _recount_friends([instance.pk, *pk_set])
+
+
+@receiver(m2m_changed, sender=UserProfile.friends.through)
+def update_friend_graph(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._graph_cleared_ids = list(instance.friends.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        record_change([instance.pk, *getattr(instance, '_graph_cleared_ids', [])])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        record_change([instance.pk, *pk_set])
+
+
+@receiver(m2m_changed, sender=UserProfile.friends.through)
+def invalidate_friend_sidebars(sender, instance, action, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._sidebar_cleared_ids = list(instance.friends.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        profile_ids = [instance.pk, *(pk_set or getattr(instance, '_sidebar_cleared_ids', []))]
+        invalidate_sidebars(
+            UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_user_for_search(sender, instance, created, update_fields=None, **kwargs):
+    if created or not (update_fields and set(update_fields) <= {'last_login'}):
+        index_user(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def update_typeahead(sender, instance, update_fields=None, **kwargs):
+    if not (update_fields and set(update_fields) <= {'last_login'}):
+        typeahead.record_change(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_renamed_user_sidebars(sender, instance, created, update_fields=None, **kwargs):
+    # Friends' sidebars show this user's username. Logins only touch
+    # last_login and are skipped.
+    if created:
+        invalidate_sidebars([instance.pk])
+    elif not (update_fields and set(update_fields) <= {'last_login'}):
+        invalidate_sidebars(friend_ids(instance.pk))
+
+
+@receiver(m2m_changed, sender=UserProfile.friends.through)
+def invalidate_friend_suggestions(sender, instance, action, pk_set, **kwargs):
+    # Friends of both ends see a different two-hop neighbourhood too. On
+    # remove and clear they must be collected before the rows go away.
+    if action in ('pre_remove', 'pre_clear', 'post_add'):
+        profile_ids = [instance.pk, *(pk_set or ())]
+        if action == 'pre_clear':
+            profile_ids += list(instance.friends.values_list('pk', flat=True))
+        invalidate_suggestions(
+            UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True)
+        )
+
 
+@receiver(post_save, sender=FriendRequest)
+@receiver(post_delete, sender=FriendRequest)
+def invalidate_request_suggestions(sender, instance, **kwargs):
+    # Pending requests are left out of suggestions.
+    invalidate_suggestions([instance.sender_id, instance.receiver_id], include_friends=False)
@@ -0,0 +1,101 @@
+# core/storage.py
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_PREFIX + '/')
+
+
+def blob_name(digest, extension):
+    """blobs/ab/cd/abcd…ef.jpg: two levels of sharding keep directories small."""
+    return f"{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file once per content digest.
+
+    Uploads are hashed while they are streamed to a temporary file next to
+    the blob directory and then renamed into place, so each byte is read
+    once. Saving content that is already stored just bumps the blob's
+    reference count in MediaBlob; delete() drops a reference and only
+    removes the file when none are left. Names that aren't blobs (uploads
+    from before this storage) are deleted directly.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save(), so the
+        # usual "does this name exist" probing is pointless here.
+        return name
+
+    def _save(self, name, content):
+        from .models import MediaBlob
+
+        extension = Path(name).suffix.lower()
+        tmp_dir = os.path.join(self.location, 'tmp', BLOB_PREFIX)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+
+        key = blob_name(digest.hexdigest(), extension)
+        final_path = self.path(key)
+        try:
+            with transaction.atomic():
+                # Take the blob's row lock before looking at the file, so a
+                # concurrent delete() can't unlink it between the check and
+                # the reference being counted.
+                if not MediaBlob.objects.filter(name=key).update(refcount=F('refcount') + 1):
+                    try:
+                        with transaction.atomic():
+                            MediaBlob.objects.create(name=key, size=size, refcount=1)
+                    except IntegrityError:
+                        MediaBlob.objects.filter(name=key).update(refcount=F('refcount') + 1)
+                if os.path.exists(final_path):
+                    os.remove(tmp.name)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp.name, final_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(final_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+        return key
+
+    def delete(self, name):
+        if not is_blob(name):
+            return super().delete(name)
+
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            # The update locks the row; the file is unlinked before that
+            # lock is released, so _save() never counts a reference to a
+            # file that is about to go.
+            tracked = MediaBlob.objects.filter(name=name).update(refcount=F('refcount') - 1)
+            released, _ = MediaBlob.objects.filter(name=name, refcount__lte=0).delete()
+            # An untracked blob is a leftover nothing refers to (the orphan
+            # sweep only reaches files past its grace period).
+            if released or not tracked:
+                super().delete(name)
@@ -0,0 +1,167 @@
+# core/suggestions.py
+#
+# Friend-of-friend suggestions. Candidates are everyone two hops away in the
+# friends graph who isn't already a friend or part of a pending friend
+# request; they are ranked by number of mutual friends, ties broken by an
+# Adamic-Adar score (a mutual friend with few friends says more than one
+# with thousands). The whole ranking is one aggregated query over the
+# friends table, and each user's top FRIEND_SUGGESTIONS_LIMIT is cached in
+# FRIEND_SUGGESTIONS_CACHE until a friendship or friend request involving
+# them or their friends changes. `manage.py build_friend_suggestions`
+# precomputes the same ranking for everyone into FriendSuggestion, which is
+# read before falling back to the live query.
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Greatest, Ln
+
+from .caching import get_cache, get_or_compute
+from .models import FriendRequest, FriendSuggestion, UserProfile
+
+Friendship = UserProfile.friends.through
+
+MUTUAL_NAMES_SHOWN = 3
+
+
+def suggestions_cache():
+    return get_cache(settings.FRIEND_SUGGESTIONS_CACHE)
+
+
+def _cache_key(user_id):
+    return f'friend_suggestions:{user_id}'
+
+
+def _pending_request_user_ids(user_id):
+    pending = FriendRequest.objects.filter(
+        Q(sender_id=user_id) | Q(receiver_id=user_id), accepted=False,
+    ).values_list('sender_id', 'receiver_id')
+    return {other for pair in pending for other in pair if other != user_id}
+
+
+def compute_suggestions(user_id, limit=None):
+    """
+    Rank friend-of-friend candidates for user_id. Returns a list of dicts
+    with user_id, mutual_count and up to MUTUAL_NAMES_SHOWN mutual_names,
+    best first.
+    """
+    limit = limit or settings.FRIEND_SUGGESTIONS_LIMIT
+    profile_id = UserProfile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+    if profile_id is None:
+        return []
+    friend_ids = Friendship.objects.filter(from_userprofile_id=profile_id).values('to_userprofile_id')
+
+    # Each friends row (mutual -> candidate) leaving one of my friends is
+    # one path of length two; grouping by candidate counts the mutuals.
+    ranked = (
+        Friendship.objects
+        .filter(from_userprofile_id__in=friend_ids)
+        .exclude(to_userprofile_id=profile_id)
+        .exclude(to_userprofile_id__in=friend_ids)
+        .exclude(to_userprofile__user_id__in=_pending_request_user_ids(user_id))
+        .values('to_userprofile_id', 'to_userprofile__user_id')
+        .annotate(
+            mutual_count=Count('*'),
+            # friend_count is a denormalized counter; clamp it so a stale
+            # zero can't make Ln() zero and the division fail.
+            score=Sum(Value(1.0) / Ln(
+                Cast(Greatest(F('from_userprofile__friend_count'), 1), FloatField()) + 1.0
+            )),
+        )
+        .order_by('-mutual_count', '-score', 'to_userprofile_id')[:limit]
+    )
+    return _with_mutual_names(profile_id, [
+        (row['to_userprofile_id'], row['to_userprofile__user_id'], row['mutual_count'])
+        for row in ranked
+    ])
+
+
+def _with_mutual_names(profile_id, ranked):
+    """ranked: (candidate profile id, candidate user id, mutual count) tuples."""
+    if not ranked:
+        return []
+    friend_ids = Friendship.objects.filter(from_userprofile_id=profile_id).values('to_userprofile_id')
+    names = defaultdict(list)
+    mutual_rows = (
+        Friendship.objects
+        .filter(from_userprofile_id__in=friend_ids,
+                to_userprofile_id__in=[candidate_id for candidate_id, _, _ in ranked])
+        .order_by('from_userprofile__user__username')
+        .values_list('to_userprofile_id', 'from_userprofile__user__username')
+    )
+    for candidate_id, username in mutual_rows:
+        if len(names[candidate_id]) < MUTUAL_NAMES_SHOWN:
+            names[candidate_id].append(username)
+
+    return [
+        {'user_id': user_id, 'mutual_count': mutual_count, 'mutual_names': names[candidate_id]}
+        for candidate_id, user_id, mutual_count in ranked
+    ]
+
+
+def stored_suggestions(user_id):
+    """Rows written by build_friend_suggestions, or None if there are none."""
+    rows = list(
+        FriendSuggestion.objects.filter(user_id=user_id).order_by('rank')
+        .values_list('suggested__userprofile__id', 'suggested_id', 'mutual_count')
+    )
+    if not rows:
+        return None
+    profile_id = UserProfile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+    return _with_mutual_names(profile_id, rows)
+
+
+def replace_stored_suggestions(rows_by_user):
+    """
+    Swap in freshly built suggestions. rows_by_user maps a user id to
+    (suggested user id, mutual count, score) tuples, best first.
+    """
+    with transaction.atomic():
+        FriendSuggestion.objects.filter(user_id__in=list(rows_by_user)).delete()
+        FriendSuggestion.objects.bulk_create([
+            FriendSuggestion(user_id=user_id, suggested_id=suggested_id,
+                             mutual_count=mutual_count, score=score, rank=rank)
+            for user_id, rows in rows_by_user.items()
+            for rank, (suggested_id, mutual_count, score) in enumerate(rows)
+        ], batch_size=1000)
+    suggestions_cache().delete_many([_cache_key(user_id) for user_id in rows_by_user])
+
+
+def get_suggestions(user_id):
+    """
+    The cached top suggestions for user_id. On a miss they come from the
+    rows build_friend_suggestions stored, or are computed live.
+    """
+    def load():
+        suggestions = stored_suggestions(user_id)
+        return compute_suggestions(user_id) if suggestions is None else suggestions
+
+    return get_or_compute(
+        suggestions_cache(), _cache_key(user_id), load, settings.FRIEND_SUGGESTIONS_TIMEOUT,
+    )
+
+
+def invalidate_suggestions(user_ids, include_friends=True):
+    """
+    Drop cached suggestions for user_ids and, with include_friends, for
+    their friends too: a friendship between A and B changes the two-hop
+    neighbourhood of everyone adjacent to either of them.
+    """
+    user_ids = set(user_ids)
+    if include_friends and user_ids:
+        user_ids.update(
+            Friendship.objects.filter(from_userprofile__user_id__in=user_ids)
+            .values_list('to_userprofile__user_id', flat=True)
+        )
+    # On commit: dropped any earlier, a concurrent reader could recompute
+    # them from the old friendships and cache that for the full timeout,
+    # and a rolled-back change would still cost the precomputed rows.
+    user_ids = list(user_ids)
+
+    def drop():
+        suggestions_cache().delete_many([_cache_key(user_id) for user_id in user_ids])
+        FriendSuggestion.objects.filter(user_id__in=user_ids).delete()
+
+    transaction.on_commit(drop)
@@ -0,0 +1,89 @@
+# core/tasks.py
+#
+# Background job handlers. Imported from CoreConfig.ready() so every process
+# that can run jobs has them registered.
+
+from . import like_buffer
+from .fragments import invalidate_post_cards
+from .jobs import handler
+from .media import (
+    build_post_variants, build_profile_variants, describe_media, purge_deleted_media,
+    strip_metadata,
+)
+from .models import Post, UserProfile
+from .timeline import backfill_author, backfill_friendship, fan_out_post
+from .uploads import attach_upload
+
+
+# These update() rather than save(), so they drop the cached cards
+# themselves.
+
+def _mark_post_media_failed(post_id):
+    Post.objects.filter(pk=post_id).update(media_status='failed')
+    invalidate_post_cards([post_id])
+
+
+@handler('process_post_media', on_failure=_mark_post_media_failed)
+def process_post_media(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None:
+        return
+    if post.image and strip_metadata(post.image):
+        post.save(update_fields=['image'])
+    describe_media(post)
+    for field_file in (post.image, post.video):
+        if field_file:
+            field_file.close()
+    post.media_status = 'ready'
+    post.save(update_fields=[
+        'media_kind', 'media_mime', 'media_width', 'media_height', 'media_duration', 'media_status',
+    ])
+    build_post_variants(post)
+
+
+def _mark_upload_failed(upload_id):
+    post_ids = list(Post.objects.filter(video_upload__pk=upload_id).values_list('pk', flat=True))
+    Post.objects.filter(pk__in=post_ids).update(media_status='failed')
+    invalidate_post_cards(post_ids)
+
+
+@handler('attach_video_upload', on_failure=_mark_upload_failed)
+def attach_video_upload(upload_id):
+    post = attach_upload(upload_id)
+    if post is not None:
+        process_post_media(post.pk)
+
+
+@handler('process_profile_picture')
+def process_profile_picture(profile_id):
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None or not profile.profile_picture:
+        return
+    if strip_metadata(profile.profile_picture):
+        profile.save(update_fields=['profile_picture'])
+    build_profile_variants(profile)
+
+
+@handler('fan_out_post')
+def fan_out_post_job(post_id):
+    fan_out_post(post_id)
+
+
+@handler('backfill_friendship')
+def backfill_friendship_job(user_a_id, user_b_id):
+    backfill_friendship(user_a_id, user_b_id)
+
+
+@handler('backfill_author')
+def backfill_author_job(author_id):
+    backfill_author(author_id)
+
+
+@handler('purge_media')
+def purge_media():
+    purge_deleted_media()
+
+
+@handler('flush_likes')
+def flush_likes():
+    like_buffer.flush()
@@ -0,0 +1,35 @@
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+def _by_width(variants, fmt):
+    keys = (variants or {}).get(fmt) or {}
+    return sorted((int(width), key) for width, key in keys.items())
+
+
+@register.filter
+def srcset(variants, fmt='jpeg'):
+    """
+    {{ post.image_variants|srcset:"webp" }} -> "url 40w, url 320w, ..."
+    Empty when the image has no variants yet.
+    """
+    return ', '.join(
+        f"{default_storage.url(key)} {width}w" for width, key in _by_width(variants, fmt)
+    )
+
+
+@register.filter
+def variant_url(variants, width):
+    """
+    URL of the narrowest JPEG variant at least `width` pixels wide, falling
+    back to the widest one. Empty when the image has no variants yet.
+    """
+    candidates = _by_width(variants, 'jpeg')
+    if not candidates:
+        return ''
+    for variant_width, key in candidates:
+        if variant_width >= int(width):
+            return default_storage.url(key)
+    return default_storage.url(candidates[-1][1])
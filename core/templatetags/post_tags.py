@@ -0,0 +1,14 @@
+from django import template
+
+from core.fragments import render_post_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts, template_name):
+    """
+    {% post_cards posts "post_card.html" %} -> every post's card, from the
+    fragment cache where possible. Posts should have liked_by_user set.
+    """
+    return render_post_cards(posts, template_name)
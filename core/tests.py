@@ -1,3 +1,1101 @@
-from django.test import TestCase
+from array import array
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+import importlib.util
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from .caching import bump_versions, get_or_compute, versioned_key
+from .checks import check_shared_caches
+from .context_processors import sidebar_data
+from .counters import reconcile_post_counters
+from .forms import PostForm
+from .fragments import render_post_cards
+from .friend_graph import (
+    are_friends, friend_count, friend_ids, friend_ids_many, graph_cache, mutual_friend_ids,
+)
+from .jobs import enqueue, handler, work
+from .media import build_post_variants, generate_variants, purge_deleted_media, sweep_orphaned_media
+from . import like_buffer, typeahead
+from . import likes
+from .likes import like_states, liked_post_ids, toggle_like
+from .models import (
+    Comment, FriendRequest, FriendSuggestion, Job, Like, MediaBlob, MediaDeletion, Post,
+    PostSearchTerm, TimelineEntry, UserProfile, VideoUpload,
+)
+from .tasks import _mark_post_media_failed, process_post_media
+from .uploads import complete_upload, expire_stale_uploads, start_upload, temp_path, write_chunk
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .post_search import search_posts
+from .search import search_user_ids
+from .sidebar import sidebar_cache, sidebar_friends
+from .suggestions import _cache_key, compute_suggestions, get_suggestions, suggestions_cache
+from .timeline import backfill_friendship, fan_out_post, home_timeline, purge_friendship, trim_timeline
+
+User = get_user_model()
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        now = timezone.now()
+        # Two posts share a timestamp so the id tie-break is exercised.
+        self.posts = [
+            Post.objects.create(user=self.user, content=str(i),
+                                created_at=now - timedelta(minutes=i // 2))
+            for i in range(5)
+        ]
+
+    def test_cursor_round_trip(self):
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 42)), (now, 42))
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('not-a-cursor')
+
+    def test_pages_cover_every_post_once(self):
+        for post in self.posts:
+            fan_out_post(post.pk)
+        seen, cursor = [], None
+        while True:
+            page, cursor = home_timeline(self.user, cursor, page_size=2)
+            seen.extend(p.pk for p in page)
+            if cursor is None:
+                break
+        expected = Post.objects.order_by('-created_at', '-id').values_list('pk', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_feed_rejects_bad_cursor(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('feed'), {'cursor': '!!'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FeedQueryCountTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.client.force_login(self.viewer)
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = User.objects.create_user(f'author{Post.objects.count()}', password='pw')
+            author.userprofile.friends.add(self.viewer.userprofile)
+            post = Post.objects.create(user=author, content='hello')
+            fan_out_post(post.pk)
+            toggle_like(self.viewer, post)
+            Comment.objects.create(user=self.viewer, post=post, text='hi')
+
+    def count_feed_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_is_independent_of_post_count(self):
+        self.add_posts(2)
+        few = self.count_feed_queries()
+        self.add_posts(10)
+        many = self.count_feed_queries()
+        self.assertEqual(few, many)
+
+    def test_counts_and_liked_state_are_annotated(self):
+        self.add_posts(1)
+        response = self.client.get(reverse('feed'))
+        post = response.context['posts'][0]
+        self.assertEqual((post.like_count, post.comment_count), (1, 1))
+        self.assertTrue(post.liked_by_user)
+
+
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.post = Post.objects.create(user=self.user, content='x')
+
+    def counts(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.comment_count
+
+    def test_counters_follow_likes_and_comments(self):
+        toggle_like(self.user, self.post)
+        comment = Comment.objects.create(user=self.user, post=self.post, text='c')
+        self.assertEqual(self.counts(), (1, 1))
+        toggle_like(self.user, self.post)
+        comment.delete()
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_cascaded_comments_are_counted_off_in_bulk(self):
+        other = User.objects.create_user('eve', password='pw')
+        own = Post.objects.create(user=other, content='mine')
+        for post in (self.post, self.post, own, own):
+            Comment.objects.create(user=other, post=post, text='c')
+        Comment.objects.create(user=self.user, post=own, text='c')
+
+        with CaptureQueriesContext(connection) as queries:
+            other.delete()
+        updates = [q['sql'] for q in queries if 'SET "comment_count"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        toggle_like(self.user, self.post)
+        Post.objects.filter(pk=self.post.pk).update(like_count=7, comment_count=3)
+        self.assertEqual(reconcile_post_counters(), 1)
+        self.assertEqual(self.counts(), (1, 0))
+
+
+class LikeServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('carol', password='pw')
+        self.post = Post.objects.create(user=self.user, content='x')
+
+    def test_toggle_flips_state_and_count(self):
+        self.assertEqual(toggle_like(self.user, self.post), (True, 1))
+        self.assertEqual(toggle_like(self.user, self.post), (False, 0))
+
+    def test_toggle_never_reads_the_likes(self):
+        with CaptureQueriesContext(connection) as queries:
+            toggle_like(self.user, self.post)
+        statements = [q['sql'].split()[0].upper() for q in queries]
+        self.assertNotIn('SELECT', statements)
+        self.assertEqual(Like.objects.get().created_at.date(), timezone.now().date())
+
+    def test_duplicate_insert_is_ignored(self):
+        # What a toggle racing a concurrent like of the same post sees.
+        self.assertEqual(likes._insert_like(self.user.pk, self.post.pk), 1)
+        self.assertEqual(likes._insert_like(self.user.pk, self.post.pk), 0)
+        self.assertEqual(Like.objects.count(), 1)
+        # Backends without an INSERT ... IGNORE spelling.
+        with mock.patch.dict(likes.INSERT_IGNORE, clear=True):
+            self.assertEqual(likes._insert_like(self.user.pk, self.post.pk), 0)
+            Like.objects.all().delete()
+            self.assertEqual(likes._insert_like(self.user.pk, self.post.pk), 1)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_deleting_a_user_releases_their_likes(self):
+        fan = User.objects.create_user('fan', password='pw')
+        toggle_like(fan, self.post)
+        fan.delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+
+
+@override_settings(LIKES_WRITE_BEHIND=True)
+class WriteBehindLikeTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.users = [User.objects.create_user(f'fan{i}', password='pw') for i in range(3)]
+        self.post = Post.objects.create(user=self.users[0], content='hot')
+
+    def test_buffered_likes_are_visible_then_flushed_in_bulk(self):
+        counts = [toggle_like(user, self.post)[1] for user in self.users]
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertEqual(toggle_like(self.users[0], self.post), (False, 2))
+        self.assertFalse(Like.objects.exists())
+        self.assertTrue(Job.objects.filter(kind='flush_likes').exists())
+        self.assertEqual(like_states(self.users[1], [self.post.pk]), {self.post.pk: (2, True)})
+        self.assertEqual(like_states(self.users[0], [self.post.pk]), {self.post.pk: (2, False)})
+
+        self.assertEqual(like_buffer.flush(), 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 2)
+        self.assertEqual(like_buffer.buffered_deltas([self.post.pk]), {})
+        self.assertEqual(like_states(self.users[1], [self.post.pk]), {self.post.pk: (2, True)})
+        self.assertEqual(like_buffer.flush(), 0)
+
+    def test_flush_skips_posts_and_users_deleted_since_the_toggle(self):
+        gone = Post.objects.create(user=self.users[0], content='gone')
+        toggle_like(self.users[1], gone)
+        toggle_like(self.users[1], self.post)
+        toggle_like(self.users[2], self.post)
+        gone.delete()
+        self.users[2].delete()
+
+        self.assertEqual(like_buffer.flush(), 3)
+        connection.check_constraints()
+        self.assertEqual(list(Like.objects.values_list('user', 'post')),
+                         [(self.users[1].pk, self.post.pk)])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(like_buffer.buffered_deltas([gone.pk]), {})
+
+
+class LikeStateEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dora', password='pw')
+        self.posts = [Post.objects.create(user=self.user, content=str(i)) for i in range(3)]
+        toggle_like(self.user, self.posts[1])
+        self.client.force_login(self.user)
+
+    def get_state(self, ids, **headers):
+        return self.client.get(reverse('like_state'), {'ids': ','.join(map(str, ids))}, **headers)
+
+    def test_batch_state_in_one_query(self):
+        ids = [post.pk for post in self.posts] + [9999]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get_state(ids)
+        self.assertEqual(len([q for q in queries if 'core_post' in q['sql']]), 1)
+        self.assertEqual(response.json()['posts'], {
+            str(self.posts[0].pk): {'total_likes': 0, 'liked': False},
+            str(self.posts[1].pk): {'total_likes': 1, 'liked': True},
+            str(self.posts[2].pk): {'total_likes': 0, 'liked': False},
+        })
+
+    def test_unchanged_batch_is_not_modified(self):
+        ids = [post.pk for post in self.posts]
+        etag = self.get_state(ids)['ETag']
+        self.assertEqual(self.get_state(ids, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        toggle_like(self.user, self.posts[0])
+        self.assertEqual(self.get_state(ids, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(LIKE_STATE_MAX_IDS=2)
+    def test_rejects_bad_or_oversized_batches(self):
+        self.assertEqual(self.get_state([1, 2, 3]).status_code, 400)
+        self.assertEqual(self.client.get(reverse('like_state'), {'ids': '1,x'}).status_code, 400)
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('dave', password='pw')
+        self.friend = User.objects.create_user('erin', password='pw')
+        self.stranger = User.objects.create_user('frank', password='pw')
+        self.author.userprofile.friends.add(self.friend.userprofile)
+
+    def timeline(self, user):
+        return [post.pk for post in home_timeline(user, page_size=100)[0]]
+
+    def test_fan_out_reaches_author_and_friends_only(self):
+        post = Post.objects.create(user=self.author, content='x')
+        fan_out_post(post.pk)
+        self.assertEqual(self.timeline(self.author), [post.pk])
+        self.assertEqual(self.timeline(self.friend), [post.pk])
+        self.assertEqual(self.timeline(self.stranger), [])
+
+    def test_trim_keeps_newest_entries(self):
+        posts = [Post.objects.create(user=self.author, content=str(i)) for i in range(5)]
+        for post in posts:
+            fan_out_post(post.pk)
+        self.assertEqual(trim_timeline(self.friend.pk, max_length=2), 3)
+        self.assertEqual(self.timeline(self.friend), [posts[4].pk, posts[3].pk])
+
+    @override_settings(TIMELINE_MAX_LENGTH=2)
+    def test_fan_out_trims_every_recipient_in_one_statement(self):
+        self.author.userprofile.friends.add(self.stranger.userprofile)
+        posts = [Post.objects.create(user=self.author, content=str(i)) for i in range(3)]
+        for post in posts[:2]:
+            fan_out_post(post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            fan_out_post(posts[2].pk)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE')]), 1)
+        for user in (self.author, self.friend, self.stranger):
+            self.assertEqual(self.timeline(user), [posts[2].pk, posts[1].pk])
+
+    def test_backfill_and_purge_follow_friendship(self):
+        post = Post.objects.create(user=self.stranger, content='x')
+        fan_out_post(post.pk)
+        backfill_friendship(self.author.pk, self.stranger.pk)
+        self.assertEqual(self.timeline(self.author), [post.pk])
+        purge_friendship(self.author.pk, self.stranger.pk)
+        self.assertEqual(self.timeline(self.author), [])
+        self.assertTrue(TimelineEntry.objects.filter(user=self.stranger, post=post).exists())
+
+
+@override_settings(TIMELINE_FANOUT_MAX_FRIENDS=1)
+class HybridFanOutTests(TestCase):
+    def setUp(self):
+        self.celebrity = User.objects.create_user('gina', password='pw')
+        self.fans = [User.objects.create_user(f'fan{i}', password='pw') for i in range(2)]
+        self.friend = User.objects.create_user('hank', password='pw')
+        for fan in self.fans:
+            self.celebrity.userprofile.friends.add(fan.userprofile)
+        self.fans[0].userprofile.friends.add(self.friend.userprofile)
+
+    def test_friend_count_is_maintained(self):
+        self.celebrity.userprofile.refresh_from_db()
+        self.assertEqual(self.celebrity.userprofile.friend_count, 2)
+        self.celebrity.userprofile.friends.remove(self.fans[1].userprofile)
+        self.celebrity.userprofile.refresh_from_db()
+        self.assertEqual(self.celebrity.userprofile.friend_count, 1)
+
+    def test_posts_stay_visible_when_the_author_drops_under_the_limit(self):
+        post = Post.objects.create(user=self.celebrity, content='x')
+        fan_out_post(post.pk)
+        self.assertEqual([p.pk for p in home_timeline(self.fans[0])[0]], [post.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.celebrity.userprofile.friends.remove(self.fans[1].userprofile)
+        self.assertEqual([p.pk for p in home_timeline(self.fans[0])[0]], [post.pk])
+
+    def test_high_degree_posts_are_merged_at_read_time(self):
+        now = timezone.now()
+        loud = [Post.objects.create(user=self.celebrity, content=str(i),
+                                    created_at=now - timedelta(minutes=2 * i)) for i in range(3)]
+        quiet = [Post.objects.create(user=self.friend, content=str(i),
+                                     created_at=now - timedelta(minutes=2 * i + 1)) for i in range(3)]
+        for post in loud + quiet:
+            fan_out_post(post.pk)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.fans[0], post__in=loud).exists())
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = home_timeline(self.fans[0], cursor, page_size=2)
+            seen.extend(post.pk for post in page)
+            if cursor is None:
+                break
+        expected = [p.pk for pair in zip(loud, quiet) for p in pair]
+        self.assertEqual(seen, expected)
+
+
+def image_upload(name='photo.png', size=(64, 48), fmt='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'purple').save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class MediaTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user('ivy', password='pw')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+
+class MediaMetadataTests(MediaTestCase):
+    def create_post(self, files):
+        form = PostForm({'content': 'media'}, files)
+        self.assertTrue(form.is_valid(), form.errors)
+        post = form.save(commit=False)
+        post.user = self.user
+        post.save()
+        process_post_media(post.pk)
+        post.refresh_from_db()
+        return post
+
+    def test_processing_records_image_metadata(self):
+        post = self.create_post({'image': image_upload()})
+        self.assertEqual(
+            (post.media_status, post.media_kind, post.media_mime, post.media_width, post.media_height),
+            ('ready', 'image', 'image/png', 64, 48),
+        )
+
+    def test_processing_records_video_mime(self):
+        video = SimpleUploadedFile('clip.webm', b'not really a video', content_type='video/webm')
+        post = self.create_post({'video': video})
+        self.assertEqual((post.media_kind, post.media_mime), ('video', 'video/webm'))
+
+    def test_processing_strips_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotate 90 degrees
+        exif[0x010F] = 'Camera Inc.'
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG', exif=exif.tobytes())
+        post = self.create_post({'image': SimpleUploadedFile('cam.jpg', buffer.getvalue())})
+        with post.image.open('rb'), Image.open(post.image) as image:
+            self.assertEqual(dict(image.getexif()), {})
+            self.assertEqual(image.size, (20, 40))
+
+
+class ImageVariantTests(MediaTestCase):
+    @override_settings(IMAGE_VARIANT_WIDTHS=(40, 320, 640), IMAGE_VARIANT_FORMATS=('webp', 'jpeg'))
+    def test_variants_are_generated_up_to_source_width(self):
+        post = Post.objects.create(user=self.user, content='x', image=image_upload(size=(400, 300)),
+                                   media_kind='image')
+        build_post_variants(post)
+        post.refresh_from_db()
+        self.assertEqual(sorted(post.image_variants), ['jpeg', 'webp'])
+        self.assertEqual(sorted(post.image_variants['jpeg'], key=int), ['40', '320'])
+        with post.image.storage.open(post.image_variants['webp']['320']) as f:
+            self.assertEqual(Image.open(f).size, (320, 240))
+
+    def test_unreadable_image_has_no_variants(self):
+        post = Post.objects.create(user=self.user, content='x',
+                                   image=SimpleUploadedFile('bad.jpg', b'nope'))
+        self.assertEqual(generate_variants(post.image), {})
+
+
+calls = []
+
+
+@handler('test_record', on_failure=lambda **payload: calls.append(('gave up', payload)))
+def record(value, fail=False):
+    if fail:
+        raise RuntimeError('boom')
+    calls.append(value)
+
+
+@override_settings(JOB_RETRY_DELAY=0)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_once_in_order(self):
+        first = enqueue('test_record', value=1)
+        enqueue('test_record', value=2)
+        self.assertEqual(work(burst=True), 2)
+        self.assertEqual(calls, [1, 2])
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (Job.DONE, 1))
+        self.assertEqual(work(burst=True), 0)
+
+    def test_failing_job_is_retried_then_given_up(self):
+        job = enqueue('test_record', max_attempts=2, value=3, fail=True)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(work(burst=True), 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('boom', job.last_error)
+        self.assertEqual(calls, [('gave up', {'value': 3, 'fail': True})])
+
+    def test_post_create_queues_media_processing(self):
+        user = User.objects.create_user('jack', password='pw')
+        self.client.force_login(user)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            self.client.post(reverse('post_create'), {'content': 'hi', 'image': image_upload()})
+            post = Post.objects.get()
+            self.assertEqual(post.media_status, 'pending')
+            self.assertEqual(
+                sorted(Job.objects.values_list('kind', flat=True)),
+                ['fan_out_post', 'process_post_media'],
+            )
+            work(burst=True)
+        post.refresh_from_db()
+        self.assertEqual(post.media_status, 'ready')
+        self.assertTrue(TimelineEntry.objects.filter(user=user, post=post).exists())
+
+
+@override_settings(JOBS_RUN_INLINE=False)
+class MediaDeletionTests(MediaTestCase):
+    def test_post_delete_queues_files_instead_of_deleting(self):
+        post = Post.objects.create(user=self.user, content='x', image=image_upload())
+        storage, name = post.image.storage, post.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(list(MediaDeletion.objects.values_list('name', flat=True)), [name])
+        self.assertTrue(Job.objects.filter(kind='purge_media', status=Job.QUEUED).exists())
+
+        self.assertEqual(purge_deleted_media(batch_size=1), 1)
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaDeletion.objects.exists())
+
+    def test_sweep_finds_unreferenced_files_only(self):
+        kept = Post.objects.create(user=self.user, content='x', image=image_upload('kept.png'))
+        stray = kept.image.storage.save('post_images/stray.png', image_upload('stray.png', size=(5, 5)))
+        self.assertEqual(sweep_orphaned_media(grace=0), [stray])
+        self.assertEqual(sweep_orphaned_media(grace=0), [])
+        purge_deleted_media()
+        self.assertFalse(kept.image.storage.exists(stray))
+        self.assertTrue(kept.image.storage.exists(kept.image.name))
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def test_identical_uploads_share_one_blob(self):
+        first = Post.objects.create(user=self.user, content='a', image=image_upload('a.png'))
+        second = Post.objects.create(user=self.user, content='b', image=image_upload('b.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(MediaBlob.objects.get().refcount, 2)
+
+        storage = first.image.storage
+        storage.delete(first.image.name)
+        self.assertTrue(storage.exists(second.image.name))
+        storage.delete(second.image.name)
+        self.assertFalse(storage.exists(second.image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_counted_blob_always_has_its_file(self):
+        # Whatever removed the file, a save that counts a reference to the
+        # blob makes sure the file is there under the row lock.
+        storage = default_storage
+        name = storage.save('post_images/a.txt', ContentFile(b'same bytes'))
+        os.remove(storage.path(name))
+        self.assertEqual(storage.save('post_images/b.txt', ContentFile(b'same bytes')), name)
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 2)
+
+
+@override_settings(VIDEO_UPLOAD_CHUNK_SIZE=4)
+class ChunkedUploadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('video_upload', args=[upload_id]), data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resumable_upload_is_attached_to_a_post(self):
+        video = b'0123456789'
+        response = self.client.post(
+            reverse('video_upload_start'), {'filename': 'clip.mp4', 'size': len(video)},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['id']
+
+        self.assertEqual(self.put_chunk(upload_id, 0, video[:4]).json()['offset'], 4)
+        # A resent or out-of-order chunk is refused with the offset to resume from.
+        conflict = self.put_chunk(upload_id, 0, video[:4])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict['Upload-Offset'], '4')
+        self.assertEqual(self.put_chunk(upload_id, 4, video[4:]).status_code, 400)  # over chunk size
+        self.put_chunk(upload_id, 4, video[4:8])
+        self.assertEqual(
+            self.client.get(reverse('video_upload', args=[upload_id])).json()['offset'], 8)
+
+        complete = reverse('video_upload_complete', args=[upload_id])
+        self.assertEqual(self.client.post(complete, {}, content_type='application/json').status_code, 400)
+        self.put_chunk(upload_id, 8, video[8:])
+        response = self.client.post(complete, {'content': 'holiday'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        post = Post.objects.get(pk=response.json()['post_id'])
+        self.assertEqual((post.content, post.media_status), ('holiday', 'pending'))
+        work(burst=True)
+        post.refresh_from_db()
+        self.assertEqual(post.media_status, 'ready')
+        self.assertEqual(post.media_mime, 'video/mp4')
+        with post.video.open('rb') as stored:
+            self.assertEqual(stored.read(), video)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'tmp', 'uploads')), [])
+
+    def test_expiry_cleans_up_completed_uploads_that_never_attached(self):
+        uploads = []
+        for _ in range(3):
+            upload = start_upload(self.user, 'clip.mp4', 4)
+            write_chunk(upload, 0, BytesIO(b'0123'), 4)
+            complete_upload(upload, 'x')
+            uploads.append(upload)
+        uploads[0].post.delete()
+        Post.objects.filter(pk=uploads[1].post.pk).update(media_status='failed')
+        VideoUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(expire_stale_uploads(max_age=60), 2)
+        self.assertEqual(list(VideoUpload.objects.values_list('pk', flat=True)), [uploads[2].pk])
+        self.assertFalse(os.path.exists(temp_path(uploads[0])))
+        self.assertFalse(os.path.exists(temp_path(uploads[1])))
+
+    def test_rejects_unsupported_files(self):
+        response = self.client.post(
+            reverse('video_upload_start'), {'filename': 'notes.txt', 'size': 10},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ServeMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.name = default_storage.save('post_videos/clip.mp4', ContentFile(b'0123456789'))
+        self.url = settings.MEDIA_URL + self.name
+
+    def test_full_and_conditional_requests(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertIn('immutable', response['Cache-Control'])
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20-').status_code, 416)
+        # A stale If-Range gets the whole (changed) file instead of a slice.
+        stale = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+
+    def test_private_and_offloaded_files(self):
+        os.makedirs(os.path.join(self.media_root, 'tmp', 'uploads'))
+        with open(os.path.join(self.media_root, 'tmp', 'uploads', 'x.part'), 'wb') as f:
+            f.write(b'partial')
+        for path in ('tmp/uploads/x.part', './tmp/uploads/x.part',
+                     'post_images/../tmp/uploads/x.part', 'tmp//uploads/x.part'):
+            self.assertEqual(self.client.get(settings.MEDIA_URL + path).status_code, 404, path)
+        self.assertEqual(self.client.get(settings.MEDIA_URL + '../manage.py').status_code, 400)
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+
+
+class FriendGraphTestCase(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.users = {name: User.objects.create_user(name, password='pw')
+                      for name in ('me', 'ann', 'bob', 'cat', 'dan', 'eve')}
+        self.befriend('me', 'ann')
+        self.befriend('me', 'bob')
+        self.befriend('ann', 'cat')
+        self.befriend('bob', 'cat')
+        self.befriend('ann', 'dan')
+
+    def befriend(self, a, b):
+        self.users[a].userprofile.friends.add(self.users[b].userprofile)
+
+    def suggested(self, name='me'):
+        return [(User.objects.get(pk=s['user_id']).username, s['mutual_count'])
+                for s in get_suggestions(self.users[name].pk)]
+
+
+class FriendSuggestionTests(FriendGraphTestCase):
+    def test_ranked_by_mutual_friends(self):
+        self.assertEqual(self.suggested(), [('cat', 2), ('dan', 1)])
+        self.assertEqual(compute_suggestions(self.users['me'].pk)[0]['mutual_names'], ['ann', 'bob'])
+
+    def test_stale_zero_friend_count_is_ranked(self):
+        UserProfile.objects.update(friend_count=0)
+        self.assertEqual([s['mutual_count'] for s in compute_suggestions(self.users['me'].pk)], [2, 1])
+
+    def test_cache_is_invalidated_by_friendship_and_request_changes(self):
+        self.suggested()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'cat')
+        self.assertEqual(self.suggested(), [('dan', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendRequest.objects.create(sender=self.users['dan'], receiver=self.users['me'])
+        self.assertEqual(self.suggested(), [])
+        # eve befriending dan changes the two-hop view of dan's friends.
+        self.assertEqual(self.suggested('ann'), [('bob', 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('dan', 'eve')
+        self.assertEqual(self.suggested('ann'), [('bob', 2), ('eve', 1)])
+
+    def test_stored_suggestions_survive_a_rolled_back_change(self):
+        FriendSuggestion.objects.create(user=self.users['me'], suggested=self.users['cat'],
+                                        mutual_count=2, score=1.0, rank=0)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.befriend('me', 'cat')
+            raise RuntimeError
+        self.assertTrue(FriendSuggestion.objects.filter(user=self.users['me']).exists())
+
+    def test_suggestions_cached_before_the_commit_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'cat')
+            # A concurrent request still reading the old friendships.
+            suggestions_cache().set(_cache_key(self.users['me'].pk), ('stale', float('inf')))
+        self.assertEqual(self.suggested(), [('dan', 1)])
+
+    def test_view(self):
+        self.client.force_login(self.users['me'])
+        self.assertContains(self.client.get(reverse('friend_suggestions')), 'cat')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('friend_suggestions'))
+        self.assertFalse([q for q in queries if 'core_userprofile_friends' in q['sql']])
+
+
+@skipUnless(importlib.util.find_spec('scipy'), "build_friend_suggestions needs numpy and scipy")
+class BuildFriendSuggestionsTests(FriendGraphTestCase):
+    def test_batch_build_matches_live_ranking(self):
+        FriendRequest.objects.create(sender=self.users['eve'], receiver=self.users['ann'])
+        live = {name: compute_suggestions(user.pk) for name, user in self.users.items()}
+        for workers in (1, 2):
+            call_command('build_friend_suggestions', workers=workers, chunk_size=2, stdout=StringIO())
+            clear_caches()
+            for name, user in self.users.items():
+                self.assertEqual(get_suggestions(user.pk), live[name])
+        self.assertTrue(FriendSuggestion.objects.filter(user=self.users['me']).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'cat')
+        self.assertFalse(FriendSuggestion.objects.filter(user=self.users['me']).exists())
+
+
+class FriendGraphCacheTests(FriendGraphTestCase):
+    def ids(self, *names):
+        return [self.users[name].pk for name in names]
+
+    def test_answers_from_the_cache(self):
+        me, ann, bob, cat = self.ids('me', 'ann', 'bob', 'cat')
+        friend_ids_many([me, ann, bob, cat])
+        with self.assertNumQueries(0):
+            self.assertTrue(are_friends(me, ann))
+            self.assertFalse(are_friends(me, cat))
+            self.assertEqual(mutual_friend_ids(me, cat), sorted([ann, bob]))
+            self.assertEqual(friend_count(ann), 3)
+
+    def test_forgotten_on_friendship_changes(self):
+        me, ann, cat, dan = self.ids('me', 'ann', 'cat', 'dan')
+        friend_ids_many([me, ann, cat, dan])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'cat')
+            self.users['ann'].userprofile.friends.remove(self.users['dan'].userprofile)
+        self.assertTrue(are_friends(cat, me))
+        self.assertFalse(are_friends(dan, ann))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users['me'].userprofile.friends.clear()
+        self.assertEqual(list(friend_ids(me)), [])
+        self.assertFalse(are_friends(ann, me))
+
+    def test_access_checks_read_the_database(self):
+        me, cat = self.ids('me', 'cat')
+        post = Post.objects.create(user=self.users['cat'], content='friends only')
+        graph_cache().set(f'friend_graph:{me}', array('q', sorted([*friend_ids(me), cat])))
+        self.assertTrue(are_friends(me, cat))
+
+        self.client.force_login(self.users['me'])
+        response = self.client.get(reverse('user_profile', args=['cat']))
+        self.assertFalse(response.context['is_friend'])
+        self.assertEqual(search_posts(self.users['me'], 'friends')[0], [])
+        post.user = self.users['ann']
+        post.save()
+        self.assertEqual(search_posts(self.users['me'], 'friends')[0], [post])
+
+
+class SidebarTests(FriendGraphTestCase):
+    def test_lazy_and_cached(self):
+        request = RequestFactory().get('/')
+        request.user = self.users['me']
+        with self.assertNumQueries(0):
+            sidebar_data(request)  # nothing is read until a template looks
+
+        self.client.force_login(self.users['me'])
+        self.assertContains(self.client.get(reverse('friend_suggestions')), '<li>ann</li>')
+        self.assertEqual(sidebar_friends(self.users['me'].pk),
+                         [{'user_id': self.users['ann'].pk, 'username': 'ann'},
+                          {'user_id': self.users['bob'].pk, 'username': 'bob'}])
+        with self.assertNumQueries(0):
+            sidebar_friends(self.users['me'].pk)
+
+    def test_invalidated_by_friendships_and_renames(self):
+        me = self.users['me'].pk
+        sidebar_friends(me)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'eve')
+        self.assertEqual([f['username'] for f in sidebar_friends(me)], ['ann', 'bob', 'eve'])
+        ann = self.users['ann']
+        with self.captureOnCommitCallbacks(execute=True):
+            ann.username = 'anna'
+            ann.save()
+        self.assertEqual([f['username'] for f in sidebar_friends(me)], ['anna', 'bob', 'eve'])
+
+    def test_list_cached_before_the_commit_is_dropped(self):
+        me = self.users['me'].pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.befriend('me', 'eve')
+            # A concurrent request still reading the old friendships.
+            sidebar_cache().set(versioned_key(sidebar_cache(), f'sidebar:{me}'), ([], float('inf')))
+        self.assertEqual([f['username'] for f in sidebar_friends(me)], ['ann', 'bob', 'eve'])
+
+
+@override_settings(USER_SEARCH_PAGE_SIZE=2)
+class UserSearchTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        User.objects.create_user('jo_smith', first_name='José', last_name='Smith')
+        User.objects.create_user('smithers', first_name='Waylon')
+        User.objects.create_user('johnny', last_name='Smithson')
+        User.objects.create_user('alice', first_name='Alice', last_name='Jones')
+
+    def names(self, query):
+        return [User.objects.get(pk=pk).username for pk in search_user_ids(query)]
+
+    def test_ranked_prefix_matches(self):
+        self.assertEqual(self.names('smith'), ['jo_smith', 'smithers', 'johnny'])
+        self.assertEqual(self.names('jose smi'), ['jo_smith'])
+        self.assertEqual(self.names('%'), [])
+
+    def test_index_follows_user_changes(self):
+        alice = User.objects.get(username='alice')
+        alice.last_name = 'Smith'
+        alice.save()
+        self.assertIn('alice', self.names('smith'))
+        self.assertNotIn('alice', self.names('jones'))
+
+    def test_view_paginates(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('search_users'), {'q': 'smith', 'page': 2})
+        self.assertEqual([u.username for u in response.context['users']], ['johnny'])
+        self.assertEqual(response.context['page'].paginator.num_pages, 2)
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        typeahead.index = typeahead.TypeaheadIndex()
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.users = {
+            name: User.objects.create_user(name, first_name=first, last_name=last)
+            for name, first, last in [
+                ('sam_a', 'Sam', 'Archer'), ('sammy', '', ''), ('zed', 'Samuel', 'Zed'),
+                ('other', 'Olga', 'Sámson'),
+            ]
+        }
+        self.viewer.userprofile.friends.add(self.users['zed'].userprofile)
+
+    def lookup(self, prefix):
+        return [(username, friend) for _, username, _, friend
+                in typeahead.index.lookup(prefix, viewer_id=self.viewer.pk)]
+
+    def test_prefix_matches_with_friends_first(self):
+        self.assertEqual(self.lookup('sam'),
+                         [('zed', True), ('sam_a', False), ('sammy', False), ('other', False)])
+        self.assertEqual(self.lookup('samuel z'), [('zed', True)])
+        self.assertEqual(self.lookup('x'), [])
+
+    def test_index_follows_user_changes(self):
+        self.lookup('sam')  # load
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users['sammy'].username = 'tammy'
+            self.users['sammy'].save()
+            self.users['sam_a'].delete()
+        self.assertEqual(self.lookup('sam'), [('zed', True), ('other', False)])
+        self.assertEqual(self.lookup('tam'), [('tammy', False)])
+
+    def test_refresh_leaves_the_snapshot_being_read_alone(self):
+        self.lookup('sam')  # load
+        keys, users, user_keys = typeahead.index._snapshot
+        before = (list(keys), dict(users), dict(user_keys))
+        gone = self.users['sammy'].pk
+        self.users['sammy'].delete()
+        typeahead.index.refresh({gone, self.users['zed'].pk})
+        self.assertEqual((keys, users, user_keys), before)
+        self.assertEqual(self.lookup('sam'), [('zed', True), ('sam_a', False), ('other', False)])
+
+    def test_journal_entry_still_being_written_is_waited_for(self):
+        self.lookup('sam')  # load
+        # Another process has taken a journal number but not stored its entry.
+        cache.add(typeahead.JOURNAL_KEY, 0, None)
+        n = cache.incr(typeahead.JOURNAL_KEY)
+        User.objects.filter(pk=self.users['sammy'].pk).update(username='tammy')
+        with mock.patch.object(typeahead.index, '_reload') as reload:
+            self.assertEqual(self.lookup('tam'), [])
+            cache.set(typeahead._journal_entry_key(n), self.users['sammy'].pk)
+            self.assertEqual(self.lookup('tam'), [('tammy', False)])
+        reload.assert_not_called()
+
+    def test_endpoint(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse('search_typeahead'), {'q': 'Sam A'})
+        self.assertEqual(response.json()['results'], [{
+            'username': 'sam_a', 'name': 'Sam Archer', 'friend': False,
+            'url': reverse('user_profile', args=['sam_a']),
+        }])
+
+
+class PostSearchTests(FriendGraphTestCase):
+    def setUp(self):
+        super().setUp()
+        self.posts = {}
+        for i, (author, content) in enumerate([
+            ('me', 'Sunny day at the beach'),
+            ('ann', 'The beach was sunny today'),
+            ('bob', 'Photography tips for a sunny day'),
+            ('cat', 'A sunny day at the beach too'),  # not a friend of me
+        ]):
+            self.posts[author] = Post.objects.create(
+                user=self.users[author], content=content,
+                created_at=timezone.now() - timedelta(minutes=i),
+            )
+
+    def search(self, query, **kwargs):
+        posts, cursor = search_posts(self.users['me'], query, **kwargs)
+        return [post.user.username for post in posts], cursor
+
+    def test_words_phrases_and_prefixes(self):
+        self.assertEqual(self.search('sunny beach')[0], ['me', 'ann'])
+        self.assertEqual(self.search('"sunny day"')[0], ['me', 'bob'])
+        self.assertEqual(self.search('photo*')[0], ['bob'])
+        self.assertEqual(self.search('"beach was sun*"')[0], ['ann'])
+        self.assertEqual(self.search('photo')[0], [])
+
+    def test_comments_are_searched_and_kept_up_to_date(self):
+        comment = Comment.objects.create(user=self.users['cat'], post=self.posts['ann'], text='Lovely waves')
+        self.assertEqual(self.search('waves')[0], ['ann'])
+        # A phrase has to fall inside one document, not across post and comment.
+        self.assertEqual(self.search('"today lovely"')[0], [])
+        comment.delete()
+        self.assertEqual(self.search('waves')[0], [])
+
+        self.posts['bob'].content = 'Edited: waves'
+        self.posts['bob'].save()
+        self.assertEqual(self.search('photography')[0], [])
+        self.assertEqual(self.search('waves')[0], ['bob'])
+
+    def test_cursor_pagination(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = self.search('sunny', cursor=cursor, page_size=1)
+            seen += page
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['me', 'ann', 'bob'])
+
+    def test_reindex_command(self):
+        PostSearchTerm.objects.all().delete()
+        out = StringIO()
+        call_command('reindex_posts', chunk_size=2, stdout=out)
+        self.assertIn('Indexed 4 post(s)', out.getvalue())
+        self.assertEqual(self.search('"sunny day"')[0], ['me', 'bob'])
+
+    def test_view(self):
+        self.client.force_login(self.users['me'])
+        response = self.client.get(reverse('search_posts'), {'q': 'beach'})
+        self.assertContains(response, 'The beach was sunny today')
+        self.assertNotContains(response, 'beach too')
+        self.assertEqual(self.client.get(reverse('search_posts'), {'q': 'x', 'cursor': '!!'}).status_code, 400)
+
+
+class PostCardFragmentTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.author = User.objects.create_user('author', password='pw')
+        self.fan = User.objects.create_user('fan', password='pw')
+        self.post = Post.objects.create(user=self.author, content='Original text')
+
+    def card(self, viewer, template_name='post_card.html'):
+        post = Post.objects.select_related('user').get(pk=self.post.pk)
+        post.liked_by_user = post.pk in liked_post_ids(viewer, [post.pk])
+        return render_post_cards([post], template_name)
+
+    def test_card_is_cached_until_the_post_changes(self):
+        self.assertIn('Original text', self.card(self.fan))
+        Post.objects.filter(pk=self.post.pk).update(content='Changed behind the cache')
+        self.assertIn('Original text', self.card(self.fan))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.content = 'Edited text'
+            self.post.save()
+        self.assertIn('Edited text', self.card(self.fan))
+
+    def test_likes_and_comments_bump_the_version(self):
+        self.assertIn('0 likes', self.card(self.fan))
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_like(self.fan, self.post)
+        self.assertIn('1 like', self.card(self.fan))
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.fan, post=self.post, text='Nice')
+        self.assertIn('Nice', self.card(self.fan, 'profile_post_card.html'))
+
+    def test_liked_state_is_patched_per_viewer(self):
+        toggle_like(self.fan, self.post)
+        self.assertIn('bi-heart-fill', self.card(self.fan))
+        self.assertNotIn('bi-heart-fill', self.card(self.author))
+        self.assertNotIn('<!--post-card', self.card(self.author))
+
+    def test_author_rename_bumps_their_cards(self):
+        self.card(self.fan)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.username = 'renamed'
+            self.author.save()
+        self.assertIn('renamed', self.card(self.fan))
+
+    def test_commenter_rename_bumps_the_cards_they_commented_on(self):
+        Comment.objects.create(user=self.fan, post=self.post, text='Nice')
+        self.assertIn('fan</strong>', self.card(self.fan, 'profile_post_card.html'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fan.username = 'superfan'
+            self.fan.save()
+        self.assertIn('superfan</strong>', self.card(self.fan, 'profile_post_card.html'))
+
+    def test_deleted_liker_and_reconciled_counts_bump_the_card(self):
+        toggle_like(self.fan, self.post)
+        self.assertIn('1 like', self.card(self.author))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fan.delete()
+        self.assertIn('0 likes', self.card(self.author))
+
+        Post.objects.filter(pk=self.post.pk).update(like_count=5)
+        self.card(self.author)  # cached with the drifted count
+        with self.captureOnCommitCallbacks(execute=True):
+            reconcile_post_counters()
+        self.assertIn('0 likes', self.card(self.author))
+
+    def test_failed_media_bumps_the_card(self):
+        self.post.media_status = 'pending'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        self.assertIn('Processing media', self.card(self.fan))
+        with self.captureOnCommitCallbacks(execute=True):
+            _mark_post_media_failed(self.post.pk)
+        self.assertIn('could not be processed', self.card(self.fan))
+
+    def test_profile_page_renders_cards(self):
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('user_profile', args=['author']))
+        self.assertContains(response, 'Original text')
+        self.assertContains(response, 'bi-heart"')
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_named_caches_are_configured(self):
+        for alias in ('default', 'sessions', 'fragments', 'feed', 'counters'):
+            caches[alias].set('probe', alias)
+        self.assertEqual({caches[alias].get('probe') for alias in settings.CACHES},
+                         {'default', 'sessions', 'fragments', 'feed', 'counters'})
+
+    def test_per_process_shared_caches_warn_outside_debug(self):
+        with override_settings(DEBUG=True):
+            self.assertEqual(check_shared_caches(None), [])
+        with override_settings(DEBUG=False):
+            self.assertEqual([w.id for w in check_shared_caches(None)], ['core.W001'])
+            shared = {alias: {**config, 'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'}
+                      for alias, config in settings.CACHES.items()}
+            with override_settings(CACHES=shared):
+                self.assertEqual(check_shared_caches(None), [])
+
+    def test_versioned_keys_change_on_bump(self):
+        first = versioned_key(cache, 'things:1', 'page', 2)
+        self.assertEqual(versioned_key(cache, 'things:1', 'page', 2), first)
+        self.assertTrue(first.startswith('things:1:v') and first.endswith(':page:2'))
+        bump_versions(cache, ['things:1'])
+        self.assertNotEqual(versioned_key(cache, 'things:1', 'page', 2), first)
+        # An evicted version restarts somewhere new, never at an old value.
+        cache.delete('version:things:1')
+        self.assertNotIn(versioned_key(cache, 'things:1', 'page', 2), {first})
+
+    def test_get_or_compute(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(get_or_compute(cache, 'answer', compute, 60), 1)
+        self.assertEqual(get_or_compute(cache, 'answer', compute, 60), 1)
+        self.assertEqual(len(calls), 1)
+
+        # Past its soft expiry the value is served stale while someone else
+        # holds the refresh lock, and refreshed by the next caller otherwise.
+        cache.set('answer', (1, 0), 60)
+        cache.add('answer:lock', True, 30)
+        self.assertEqual(get_or_compute(cache, 'answer', compute, 60), 1)
+        cache.delete('answer:lock')
+        self.assertEqual(get_or_compute(cache, 'answer', compute, 60), 2)
+
+        # On a cold miss, a caller that loses the lock waits, then computes.
+        cache.add('cold:lock', True, 30)
+        self.assertEqual(get_or_compute(cache, 'cold', compute, 60, wait=0.1), 3)
+        self.assertIsNone(cache.get('cold'))
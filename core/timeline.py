@@ -0,0 +1,220 @@
+# core/timeline.py
+#
+# Materialized home timelines (fan-out-on-write). When a post is created its
+# id is pushed into the timeline of the author and of every friend, so
+# reading a home feed is one indexed range read on TimelineEntry.
+#
+# Authors whose friend count is above TIMELINE_FANOUT_MAX_FRIENDS are the
+# exception: fanning their posts out would write one row per friend, so they
+# only go into the author's own timeline and are merged into readers' feeds
+# at read time from each such author's recent posts (fan-out-on-read).
+# Both sides decide by UserProfile.friend_count. An author who drops back
+# under the limit leaves the read-time merge, so their recent posts are then
+# copied into their friends' timelines (backfill_author).
+
+import heapq
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from . import like_buffer
+from .friend_graph import friend_ids
+from .likes import liked_post_ids
+from .models import Post, TimelineEntry, UserProfile
+from .pagination import after_key, cut_page, decode_cursor
+
+BATCH_SIZE = 1000
+
+
+def friend_user_ids(user_id):
+    """User ids of everyone whose profile is friends with user_id's profile."""
+    return list(friend_ids(user_id))
+
+
+def high_degree_user_ids(profile_ids):
+    """User ids of the given profiles that are over the fan-out limit."""
+    return set(
+        UserProfile.objects.filter(
+            pk__in=profile_ids, friend_count__gt=settings.TIMELINE_FANOUT_MAX_FRIENDS,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def is_high_degree(user_id):
+    return UserProfile.objects.filter(
+        user_id=user_id, friend_count__gt=settings.TIMELINE_FANOUT_MAX_FRIENDS,
+    ).exists()
+
+
+def high_degree_friend_ids(user_id):
+    """Friends of user_id whose posts are merged at read time."""
+    return list(
+        UserProfile.objects.filter(
+            friends__user_id=user_id,
+            friend_count__gt=settings.TIMELINE_FANOUT_MAX_FRIENDS,
+        ).values_list('user_id', flat=True)
+    )
+
+
+def _insert(entries):
+    for start in range(0, len(entries), BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(
+            entries[start:start + BATCH_SIZE], ignore_conflicts=True
+        )
+
+
+def trim_timelines(user_ids, max_length=None):
+    """
+    Drop everything older than the newest max_length entries of each of
+    user_ids' timelines: one ranked DELETE per BATCH_SIZE users.
+    """
+    max_length = max_length or settings.TIMELINE_MAX_LENGTH
+    user_ids = list(user_ids)
+    deleted = 0
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        ranked = (
+            TimelineEntry.objects.filter(user_id__in=user_ids[start:start + BATCH_SIZE])
+            .annotate(rank=Window(
+                RowNumber(), partition_by=F('user_id'),
+                order_by=[F('created_at').desc(), F('post_id').desc()],
+            ))
+            .filter(rank__gt=max_length)
+            .values('pk')
+        )
+        deleted += TimelineEntry.objects.filter(pk__in=ranked).delete()[0]
+    return deleted
+
+
+def trim_timeline(user_id, max_length=None):
+    return trim_timelines([user_id], max_length)
+
+
+def fan_out_post(post_id):
+    """Push a new post into its author's and every friend's timeline."""
+    post = Post.objects.filter(pk=post_id).only('pk', 'user_id', 'created_at').first()
+    if post is None:
+        return 0
+    recipients = [post.user_id]
+    if not is_high_degree(post.user_id):
+        recipients += friend_user_ids(post.user_id)
+    _insert([
+        TimelineEntry(user_id=user_id, post_id=post.pk, created_at=post.created_at)
+        for user_id in recipients
+    ])
+    trim_timelines(recipients)
+    return len(recipients)
+
+
+def _copy_recent_posts(author_id, reader_id, limit):
+    if is_high_degree(author_id):
+        return
+    recent = (
+        Post.objects.filter(user_id=author_id)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'created_at')[:limit]
+    )
+    _insert([
+        TimelineEntry(user_id=reader_id, post_id=pk, created_at=created_at)
+        for pk, created_at in recent
+    ])
+
+
+def backfill_friendship(user_a_id, user_b_id):
+    """Give two new friends each other's recent posts."""
+    limit = settings.TIMELINE_BACKFILL_POSTS
+    _copy_recent_posts(user_a_id, user_b_id, limit)
+    _copy_recent_posts(user_b_id, user_a_id, limit)
+    trim_timelines([user_a_id, user_b_id])
+
+
+def backfill_author(author_id):
+    """
+    Copy an author's recent posts into every friend's timeline, for an
+    author who is no longer merged in at read time.
+    """
+    if is_high_degree(author_id):
+        return 0
+    readers = friend_user_ids(author_id)
+    recent = list(
+        Post.objects.filter(user_id=author_id)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'created_at')[:settings.TIMELINE_BACKFILL_POSTS]
+    )
+    _insert([
+        TimelineEntry(user_id=reader_id, post_id=pk, created_at=created_at)
+        for reader_id in readers
+        for pk, created_at in recent
+    ])
+    trim_timelines(readers)
+    return len(readers)
+
+
+def purge_friendship(user_a_id, user_b_id):
+    """Remove each ex-friend's posts from the other's timeline."""
+    TimelineEntry.objects.filter(
+        Q(user_id=user_a_id, post__user_id=user_b_id) |
+        Q(user_id=user_b_id, post__user_id=user_a_id)
+    ).delete()
+
+
+def rebuild_timeline(user_id):
+    """Rebuild one timeline from scratch out of own and friends' posts."""
+    high_degree = set(high_degree_friend_ids(user_id))
+    authors = [user_id] + [a for a in friend_user_ids(user_id) if a not in high_degree]
+    recent = (
+        Post.objects.filter(user_id__in=authors)
+        .order_by('-created_at', '-id')
+        .values_list('pk', 'created_at')[:settings.TIMELINE_MAX_LENGTH]
+    )
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    _insert([
+        TimelineEntry(user_id=user_id, post_id=pk, created_at=created_at)
+        for pk, created_at in recent
+    ])
+
+
+def home_timeline(user, cursor=None, page_size=20):
+    """
+    One page of user's home feed, newest first. Returns (posts, next_cursor)
+    with liked_by_user set on each post. Raises InvalidCursor on a bad cursor.
+
+    The page is a k-way merge of the materialized timeline with the recent
+    posts of each high-degree friend. Every source is read with the same
+    keyset bound and limit, so the merge never needs more than page_size + 1
+    keys from any of them.
+    """
+    key = decode_cursor(cursor) if cursor else None
+    limit = page_size + 1
+
+    def newest(queryset, id_field):
+        queryset = queryset.order_by('-created_at', f'-{id_field}')
+        if key:
+            queryset = after_key(queryset, key, id_field=id_field)
+        return list(queryset.values_list('created_at', id_field)[:limit])
+
+    sources = [newest(TimelineEntry.objects.filter(user=user), 'post_id')]
+    for author_id in high_degree_friend_ids(user.pk):
+        sources.append(newest(Post.objects.filter(user_id=author_id), 'id'))
+
+    keys, seen = [], set()
+    for created_at, post_id in heapq.merge(*sources, reverse=True):
+        if post_id in seen:
+            continue
+        seen.add(post_id)
+        keys.append((created_at, post_id))
+        if len(keys) == limit:
+            break
+
+    keys, next_cursor = cut_page(keys, page_size)
+
+    by_id = Post.objects.select_related('user', 'user__userprofile').in_bulk(
+        [post_id for _, post_id in keys]
+    )
+    posts = [by_id[post_id] for _, post_id in keys if post_id in by_id]
+    liked = liked_post_ids(user, list(by_id))
+    for post in posts:
+        post.liked_by_user = post.pk in liked
+    if like_buffer.enabled():
+        like_buffer.apply_buffered_counts(posts)
+    return posts, next_cursor
@@ -0,0 +1,215 @@
+# core/typeahead.py
+#
+# Prefix lookups over usernames and display names for the search box. Each
+# process keeps a sorted array of (folded name, user id) keys in memory, so
+# a lookup is a bisect plus a short scan, with no database or network round
+# trip. The index is built on first use and kept current incrementally:
+# user save/delete signals patch the local copy and append the user id to a
+# change journal in the cache, which other processes replay (re-reading only
+# those users) before their next lookup.
+#
+# Lookups don't take the lock: the keys, users and each user's folded keys
+# are published together as one snapshot that is replaced, never modified,
+# so a lookup sees a consistent set however a refresh interleaves with it.
+# A refresh patches copies of the current structures and publishes them
+# once per batch of journal entries.
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .friend_graph import friend_ids
+from .search import fold, tokenize
+
+User = get_user_model()
+
+JOURNAL_KEY = 'typeahead:seq'
+# Sorts after any folded name, so (prefix + END_OF_PREFIX,) bounds the keys
+# that start with prefix.
+END_OF_PREFIX = '\U0010ffff'
+# Can't occur in a folded name.
+KEY_SEPARATOR = '\x00'
+
+
+def _journal_entry_key(n):
+    return f'typeahead:change:{n}'
+
+
+def display_name(first_name, last_name):
+    return f"{first_name} {last_name}".strip()
+
+
+def _keys_for(username, name):
+    """The whole username and name, and each word of them, folded."""
+    keys = {fold(username), fold(name), *tokenize(username), *tokenize(name)}
+    keys.discard('')
+    return keys
+
+
+def _joined_keys(username, name):
+    """_keys_for as one string, each key preceded by KEY_SEPARATOR."""
+    return ''.join(KEY_SEPARATOR + key for key in sorted(_keys_for(username, name)))
+
+
+def _split_keys(joined):
+    return joined.split(KEY_SEPARATOR)[1:]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._seq = 0
+        self._stalled = None
+        # ([sorted (folded name, user id)],
+        #  {user id: (username, display name)},
+        #  {user id: that user's folded keys, each after a KEY_SEPARATOR})
+        self._snapshot = ([], {}, {})
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            self._catch_up()
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            # Remember where the journal was before reading, so changes
+            # made while loading are replayed rather than lost.
+            self._seq = cache.get(JOURNAL_KEY, 0)
+            keys, users, user_keys = [], {}, {}
+            rows = User.objects.filter(is_active=True).values_list(
+                'pk', 'username', 'first_name', 'last_name')
+            for pk, username, first_name, last_name in rows.iterator(chunk_size=5000):
+                name = display_name(first_name, last_name)
+                users[pk] = (username, name)
+                user_keys[pk] = _joined_keys(username, name)
+                keys.extend((key, pk) for key in _split_keys(user_keys[pk]))
+            keys.sort()
+            self._snapshot, self._loaded = (keys, users, user_keys), True
+
+    def _reload(self):
+        with self._lock:
+            self._loaded = False
+        self._ensure_loaded()
+
+    def _catch_up(self):
+        seq = cache.get(JOURNAL_KEY, 0)
+        if seq == self._seq:
+            return
+        numbers = range(self._seq + 1, seq + 1)
+        changed = cache.get_many([_journal_entry_key(n) for n in numbers])
+        user_ids, last = set(), self._seq
+        for n in numbers:
+            user_id = changed.get(_journal_entry_key(n))
+            if user_id is None:
+                if self._stalled != n:
+                    # Its writer has taken the number but not stored the
+                    # entry yet; replay up to here and look again next time.
+                    self._stalled = n
+                    break
+                # Still missing: the entry expired. Start over.
+                self._reload()
+                return
+            user_ids.add(user_id)
+            last = n
+        if user_ids:
+            self.refresh(user_ids)
+        self._seq = last
+
+    def refresh(self, user_ids):
+        """Re-read user_ids from the database and replace their entries."""
+        rows = {
+            pk: (username, display_name(first_name, last_name))
+            for pk, username, first_name, last_name in User.objects.filter(
+                pk__in=user_ids, is_active=True,
+            ).values_list('pk', 'username', 'first_name', 'last_name')
+        }
+        with self._lock:
+            # Copy on write, since lookups may be reading the current
+            # snapshot, then patch the copies in place and publish them once.
+            keys, users, user_keys = self._snapshot
+            keys, users, user_keys = list(keys), dict(users), dict(user_keys)
+            for user_id in user_ids:
+                users.pop(user_id, None)
+                for key in _split_keys(user_keys.pop(user_id, '')):
+                    i = bisect_left(keys, (key, user_id))
+                    if i < len(keys) and keys[i] == (key, user_id):
+                        del keys[i]
+            for user_id, entry in rows.items():
+                users[user_id] = entry
+                user_keys[user_id] = _joined_keys(*entry)
+                for key in _split_keys(user_keys[user_id]):
+                    insort(keys, (key, user_id))
+            self._snapshot = (keys, users, user_keys)
+
+    def lookup(self, prefix, viewer_id=None, limit=None):
+        """
+        Users whose username or display name (or a word of it) starts with
+        prefix: the viewer's friends first, then everyone else in key order.
+        Returns (user_id, username, display_name, is_friend) tuples.
+        """
+        limit = limit or settings.TYPEAHEAD_LIMIT
+        prefix = fold(prefix).strip()
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        friends = set(friend_ids(viewer_id)) if viewer_id else set()
+        keys, users, user_keys = self._snapshot
+        start = bisect_left(keys, (prefix,))
+
+        # Every friend matching the prefix, even when the prefix is too
+        # broad for the bounded scan below: walk whichever is smaller, the
+        # prefix's key range or the friends list.
+        friend_matches = set()
+        if friends:
+            end = bisect_left(keys, (prefix + END_OF_PREFIX,), start)
+            if end - start <= len(friends):
+                friend_matches = {keys[i][1] for i in range(start, end) if keys[i][1] in friends}
+            else:
+                # One substring search per friend over its joined keys.
+                needle = KEY_SEPARATOR + prefix
+                friend_matches = {
+                    user_id for user_id in friends if needle in user_keys.get(user_id, '')
+                }
+        friend_matches.discard(viewer_id)
+        matches = [
+            (user_id, *users[user_id], True)
+            for user_id in heapq.nsmallest(limit, friend_matches, key=lambda pk: users[pk][0])
+        ]
+        seen = set(friends)
+
+        i, scanned = start, 0
+        while (len(matches) < limit and i < len(keys) and keys[i][0].startswith(prefix)
+               and scanned < settings.TYPEAHEAD_SCAN_LIMIT):
+            user_id = keys[i][1]
+            if user_id not in seen and user_id != viewer_id:
+                seen.add(user_id)
+                matches.append((user_id, *users[user_id], False))
+            i += 1
+            scanned += 1
+        return [match for match in matches if match[0] != viewer_id][:limit]
+
+    def record_change(self, user_id):
+        """Patch this process's index and journal the change for the others."""
+        if self._loaded:
+            self.refresh({user_id})
+        cache.add(JOURNAL_KEY, 0, None)
+        n = cache.incr(JOURNAL_KEY)
+        cache.set(_journal_entry_key(n), user_id, settings.TYPEAHEAD_JOURNAL_TIMEOUT)
+        if self._seq == n - 1:
+            # Nothing else changed in between; no need to replay our own.
+            self._seq = n
+
+
+index = TypeaheadIndex()
+
+
+def record_change(user_id):
+    # After commit, so no process can re-read the user before the change
+    # is visible to it.
+    transaction.on_commit(lambda: index.record_change(user_id))
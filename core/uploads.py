@@ -0,0 +1,171 @@
+# core/uploads.py
+#
+# Resumable, chunked video uploads. A client opens an upload with the file's
+# name and size, sends the bytes in chunks of at most VIDEO_UPLOAD_CHUNK_SIZE
+# (each tagged with the offset it starts at), and completes it with the post
+# text. Each chunk is copied from the request stream straight into a temp
+# file in small pieces, so memory use doesn't grow with the video. If a
+# request is cut off, the client asks for the current offset and resends
+# from there.
+#
+# Completing an upload creates the Post right away. Moving the file into
+# media storage and processing it is left to a background job, so no
+# request waits on a multi-gigabyte copy.
+
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .jobs import enqueue
+from .media import VIDEO_MIME_TYPES
+from .models import Post, VideoUpload
+
+UPLOAD_DIR = 'tmp/uploads'
+READ_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The chunk doesn't start where the stored data ends."""
+
+
+def temp_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR, f"{upload.pk}.part")
+
+
+def start_upload(user, filename, size):
+    """Open an upload for a video of `size` bytes. Raises UploadError."""
+    filename = os.path.basename(str(filename or '')).strip()
+    if Path(filename).suffix.lower() not in VIDEO_MIME_TYPES:
+        raise UploadError("Unsupported video type.")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("Size must be a number of bytes.")
+    if not 0 < size <= settings.VIDEO_UPLOAD_MAX_SIZE:
+        raise UploadError("Video is empty or too large.")
+
+    upload = VideoUpload.objects.create(user=user, filename=filename, size=size)
+    path = temp_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Append `length` bytes read from `stream` at `offset`, which must equal
+    the bytes received so far. Returns the new offset. Raises
+    OffsetMismatch if it doesn't, UploadError for anything else; in both
+    cases the stored offset is unchanged and the chunk can be resent.
+    """
+    if upload.status != VideoUpload.UPLOADING:
+        raise UploadError("Upload is already complete.")
+    if offset != upload.received:
+        raise OffsetMismatch(upload.received)
+    if not 0 < length <= settings.VIDEO_UPLOAD_CHUNK_SIZE:
+        raise UploadError("Chunk is empty or too large.")
+    if offset + length > upload.size:
+        raise UploadError("Chunk runs past the declared size.")
+
+    written = 0
+    with open(temp_path(upload), 'r+b') as part:
+        # Anything past offset is the remainder of an interrupted chunk.
+        part.seek(offset)
+        part.truncate()
+        while written < length:
+            piece = stream.read(min(READ_SIZE, length - written))
+            if not piece:
+                break
+            part.write(piece)
+            written += len(piece)
+    if written != length:
+        raise UploadError("Chunk was cut short.")
+
+    # Only one writer can move the offset on from where it started.
+    if not VideoUpload.objects.filter(pk=upload.pk, received=offset).update(
+        received=offset + length, updated_at=timezone.now(),
+    ):
+        raise OffsetMismatch(VideoUpload.objects.get(pk=upload.pk).received)
+    upload.received = offset + length
+    return upload.received
+
+
+def complete_upload(upload, content):
+    """
+    Create the post for a fully received upload. The video is attached to
+    it by the attach_video_upload job; until then it shows as pending.
+    """
+    if upload.status != VideoUpload.UPLOADING:
+        raise UploadError("Upload is already complete.")
+    if upload.received != upload.size:
+        raise UploadError(f"Only {upload.received} of {upload.size} bytes received.")
+
+    with transaction.atomic():
+        if not VideoUpload.objects.filter(pk=upload.pk, status=VideoUpload.UPLOADING).update(
+            status=VideoUpload.COMPLETE,
+        ):
+            raise UploadError("Upload is already complete.")
+        post = Post.objects.create(
+            user=upload.user, content=content, media_kind='video', media_status='pending',
+        )
+        VideoUpload.objects.filter(pk=upload.pk).update(post=post)
+        enqueue('attach_video_upload', upload_id=str(upload.pk))
+        enqueue('fan_out_post', post_id=post.pk)
+    upload.status, upload.post = VideoUpload.COMPLETE, post
+    return post
+
+
+def attach_upload(upload_id):
+    """
+    Move a completed upload into media storage as its post's video and drop
+    the temp file. Returns the post, or None if it no longer exists.
+    """
+    upload = VideoUpload.objects.select_related('post').filter(pk=upload_id).first()
+    if upload is None or upload.post is None:
+        return None
+    post = upload.post
+    path = temp_path(upload)
+    if not post.video:
+        with open(path, 'rb') as part:
+            post.video.save(upload.filename, File(part), save=False)
+        post.save(update_fields=['video'])
+    if os.path.exists(path):
+        os.remove(path)
+    return post
+
+
+def abort_upload(upload):
+    if os.path.exists(temp_path(upload)):
+        os.remove(temp_path(upload))
+    upload.delete()
+
+
+def expire_stale_uploads(max_age=None):
+    """
+    Abort uploads that haven't received a chunk for max_age seconds, and
+    drop completed ones of the same age that never made it into a post:
+    their post was deleted, or attaching the video failed for good.
+    """
+    max_age = settings.VIDEO_UPLOAD_EXPIRY if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    stale = VideoUpload.objects.filter(
+        Q(status=VideoUpload.UPLOADING)
+        | Q(status=VideoUpload.COMPLETE, post__isnull=True)
+        | Q(status=VideoUpload.COMPLETE, post__media_status='failed'),
+        updated_at__lt=cutoff,
+    )
+    expired = 0
+    for upload in stale.iterator():
+        abort_upload(upload)
+        expired += 1
+    return expired
@@ -29,6 +29,9 @@ urlpatterns = [
     path('feed/', views.feed, name='feed'),
     path('post/create/', views.post_create, name='post_create'),
     path('post/<int:pk>/delete/', views.post_delete, name='post_delete'),
+    path('upload/video/', views.video_upload_start, name='video_upload_start'),
+    path('upload/video/<uuid:upload_id>/', views.video_upload, name='video_upload'),
+    path('upload/video/<uuid:upload_id>/complete/', views.video_upload_complete, name='video_upload_complete'),
 
     # Comments
     path('post/<int:pk>/comment/', views.comment_create, name='comment_create'),
@@ -38,6 +41,7 @@ urlpatterns = [
 
     # Likes (only AJAX)
     path('like/ajax/<int:post_id>/', views.like_post_ajax, name='like_post_ajax'),
+    path('like/state/', views.like_state, name='like_state'),
 
     # Profiles
     path('profile/', views.user_profile, name='user_profile'),
@@ -49,8 +53,9 @@ urlpatterns = [
 
     # Search
     path('search/', views.search_users, name='search_users'),
+    path('search/typeahead/', views.search_typeahead, name='search_typeahead'),
+    path('search/posts/', views.search_posts, name='search_posts'),
 
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) \
-  + static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
+] + static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS[0])
 
 
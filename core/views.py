@@ -1,18 +1,32 @@
+from django.conf import settings
 from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.db.models import Q
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_POST, require_safe
 from django.views.decorators.csrf import csrf_exempt 
 from django.contrib import messages
-from pathlib import Path
-from .models import Post, Comment, Like, UserProfile
+from .models import Post, Comment, UserProfile, VideoUpload
+from .friend_graph import db_are_friends
 from .forms import PostForm, CommentForm, UsernameChangeForm, SignUpForm, UserProfileForm
+from .likes import like_states, liked_post_ids, likes_by, toggle_like
+from .jobs import enqueue
+from .pagination import InvalidCursor, get_page_size
+from . import like_buffer, post_search, typeahead
+from .search import search_user_ids
+from .sidebar import sidebar_friends
+from .suggestions import get_suggestions
+from .timeline import home_timeline, purge_friendship
+from .uploads import OffsetMismatch, UploadError, abort_upload, complete_upload, start_upload, write_chunk
+import hashlib
 import json
 from .models import FriendRequest
 from django.contrib.auth import get_user_model
@@ -30,7 +44,9 @@ def edit_profile(request, username):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=user_profile)
         if form.is_valid():
-            form.save()
+            profile = form.save()
+            if 'profile_picture' in form.changed_data:
+                enqueue('process_profile_picture', profile_id=profile.pk)
             return redirect('user_profile', username=username)
     else:
         form = UserProfileForm(instance=user_profile)
@@ -45,7 +61,9 @@ def update_profile_pic(request):
     if request.method == 'POST':
         form = UserProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
-            form.save()
+            profile = form.save()
+            if 'profile_picture' in form.changed_data:
+                enqueue('process_profile_picture', profile_id=profile.pk)
             messages.success(request, "Profile picture updated.")
             return redirect('user_profile', username=request.user.username)
     else:
@@ -64,6 +82,7 @@ def signup_view(request):
             if 'profile_picture' in request.FILES:
                 profile.profile_picture = request.FILES['profile_picture']
                 profile.save()
+                enqueue('process_profile_picture', profile_id=profile.pk)
             login(request, user)
             return redirect('feed')
     else:
@@ -92,31 +111,22 @@ def logout_view(request):
 # ---------------- FEED VIEW ----------------
 @login_required
 def feed(request):
-    posts = Post.objects.all().order_by('-created_at')
+    # The home feed is the viewer's materialized timeline: one range read
+    # on TimelineEntry joined to post, author and profile, plus one batched
+    # "liked by me" lookup.
+    try:
+        posts, next_cursor = home_timeline(
+            request.user,
+            cursor=request.GET.get('cursor'),
+            page_size=get_page_size(request),
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
     user_profile = UserProfile.objects.filter(user=request.user).first()
 
-    for post in posts:
-        # 👇 Ensure every user has a profile to avoid template crash
-        UserProfile.objects.get_or_create(user=post.user)
-
-        if post.image:
-            ext = Path(post.image.name).suffix.lower()
-            post.media_type = 'image' if ext in ['.jpg', '.jpeg', '.png', '.gif'] else 'unknown'
-            post.media = post.image
-        elif post.video:
-            ext = Path(post.video.name).suffix.lower()
-            post.media_type = 'video' if ext in ['.mp4', '.webm', '.ogg'] else 'unknown'
-            post.media = post.video
-        else:
-            post.media_type = 'none'
-            post.media = None
-
-        post.liked_by_user = Like.objects.filter(user=request.user, post=post).exists()
-        post.total_likes = post.likes.count()
-        post.total_comments = post.comment_set.count()
-
     return render(request, 'feed.html', {
         'posts': posts,
+        'next_cursor': next_cursor,
         'user': request.user,
         'user_profile': user_profile,
     })
@@ -130,7 +140,13 @@ def post_create(request):
     if request.method == 'POST' and form.is_valid():
         post = form.save(commit=False)
         post.user = request.user
-        post.save()
+        if post.image or post.video:
+            post.media_status = 'pending'
+        with transaction.atomic():
+            post.save()
+            if post.media_status == 'pending':
+                enqueue('process_post_media', post_id=post.pk)
+            enqueue('fan_out_post', post_id=post.pk)
         return redirect('feed')
     return render(request, 'post_create.html', {'form': form})
 
@@ -142,6 +158,74 @@ def post_delete(request, pk):
     return redirect('feed')
 
 
+# ---------------- CHUNKED VIDEO UPLOAD ----------------
+# POST   upload/video/                 {"filename", "size"} -> open an upload
+# GET    upload/video/<id>/            current offset, to resume after a failure
+# PUT    upload/video/<id>/            raw chunk, Upload-Offset header
+# DELETE upload/video/<id>/            abort
+# POST   upload/video/<id>/complete/   {"content"} -> create the post
+
+def _upload_state(upload, status=200):
+    response = JsonResponse({
+        'id': str(upload.pk),
+        'offset': upload.received,
+        'size': upload.size,
+        'status': upload.status,
+        'post_id': upload.post_id,
+        'chunk_size': settings.VIDEO_UPLOAD_CHUNK_SIZE,
+    }, status=status)
+    response['Upload-Offset'] = str(upload.received)
+    return response
+
+
+@login_required
+@require_POST
+def video_upload_start(request):
+    try:
+        data = json.loads(request.body)
+        upload = start_upload(request.user, data.get('filename'), data.get('size'))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e) or 'Invalid request'}, status=400)
+    return _upload_state(upload, status=201)
+
+
+@login_required
+def video_upload(request, upload_id):
+    upload = get_object_or_404(VideoUpload, pk=upload_id, user=request.user)
+    if request.method == 'GET':
+        return _upload_state(upload)
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return JsonResponse({'deleted': True})
+    if request.method not in ('PUT', 'PATCH'):
+        return JsonResponse({'error': 'Invalid request'}, status=405)
+
+    # The body is read straight from the request stream by write_chunk;
+    # touching request.body here would buffer the whole chunk in memory.
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        write_chunk(upload, offset, request, length)
+    except OffsetMismatch:
+        upload.refresh_from_db()
+        return _upload_state(upload, status=409)
+    except (UploadError, ValueError) as e:
+        return JsonResponse({'error': str(e) or 'Invalid request'}, status=400)
+    return _upload_state(upload)
+
+
+@login_required
+@require_POST
+def video_upload_complete(request, upload_id):
+    upload = get_object_or_404(VideoUpload, pk=upload_id, user=request.user)
+    try:
+        data = json.loads(request.body or b'{}')
+        complete_upload(upload, data.get('content', ''))
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e) or 'Invalid request'}, status=400)
+    return _upload_state(upload, status=201)
+
+
 # ---------------- COMMENT VIEWS ----------------
 @login_required
 def comment_create(request, pk):
@@ -151,7 +235,8 @@ def comment_create(request, pk):
         comment = form.save(commit=False)
         comment.user = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic():
+            comment.save()
         return redirect('feed')
     return render(request, 'comment_create.html', {'form': form, 'post': post})
 
@@ -159,7 +244,8 @@ def comment_create(request, pk):
 @login_required
 def comment_delete(request, pk):
     comment = get_object_or_404(Comment, pk=pk, user=request.user)
-    comment.delete()
+    with transaction.atomic():
+        comment.delete()
     return redirect('feed')
 
 
@@ -169,11 +255,12 @@ def add_comment(request, post_id):
     if request.method == 'POST':
         text = request.POST.get('comment')
         if text:
-            Comment.objects.create(
-                user=request.user,
-                post=post,
-                text=text
-            )
+            with transaction.atomic():
+                Comment.objects.create(
+                    user=request.user,
+                    post=post,
+                    text=text
+                )
     return redirect(request.META.get('HTTP_REFERER', 'feed'))
 
 
@@ -185,7 +272,8 @@ def add_comment_ajax(request, post_id):
             data = json.loads(request.body)
             text = data.get('text')
             post = get_object_or_404(Post, id=post_id)
-            comment = Comment.objects.create(user=request.user, post=post, text=text)
+            with transaction.atomic():
+                comment = Comment.objects.create(user=request.user, post=post, text=text)
             return JsonResponse({
                 'username': request.user.username,
                 'text': comment.text,
@@ -201,28 +289,52 @@ def add_comment_ajax(request, post_id):
 def like_post_ajax(request, post_id):
     if request.method == "POST":
         post = get_object_or_404(Post, id=post_id)
-        user = request.user
-
-        if user in post.likes.all():
-            post.likes.remove(user)
-            liked = False
-        else:
-            post.likes.add(user)
-            liked = True
+        liked, total_likes = toggle_like(request.user, post)
 
         return JsonResponse({
             'liked': liked,
-            'total_likes': post.likes.count()
+            'total_likes': total_likes
         })
 
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+@require_safe
+def like_state(request):
+    # GET ?ids=1,2,3 -> like counts and the viewer's liked flags for up to
+    # LIKE_STATE_MAX_IDS posts. The ETag is a hash of the answer, so a
+    # client polling an unchanged page gets an empty 304.
+    try:
+        post_ids = sorted({int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()})
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of post ids'}, status=400)
+    if len(post_ids) > settings.LIKE_STATE_MAX_IDS:
+        return JsonResponse({'error': f'At most {settings.LIKE_STATE_MAX_IDS} ids per request'}, status=400)
+
+    states = like_states(request.user, post_ids)
+    payload = {
+        'posts': {
+            str(pk): {'total_likes': like_count, 'liked': liked}
+            for pk, (like_count, liked) in sorted(states.items())
+        }
+    }
+    body = json.dumps(payload, separators=(',', ':'))
+    etag = '"%s"' % hashlib.md5(body.encode(), usedforsecurity=False).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
 # ---------------- PROFILE VIEWS ----------------
 def user_profile(request, username):
     user = get_object_or_404(User, username=username)
     posts = Post.objects.filter(user=user).order_by('-created_at')  # ✅ Correct
-    likes = Like.objects.filter(user=user)
+    likes = likes_by(user)
     profile = UserProfile.objects.filter(user=user).first()
 
     return render(request, 'user_profile.html', {
@@ -246,21 +358,57 @@ def change_username(request):
 
 # ---------------- SEARCH VIEW ----------------
 def search_users(request):
+    # Ranked matches from the user search index (core.search), capped at
+    # USER_SEARCH_MAX_RESULTS and shown a page at a time.
     query = request.GET.get('q', '')
-    users = User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query)
-    )
-    return render(request, 'search_users.html', {'users': users, 'query': query})
+    paginator = Paginator(search_user_ids(query), settings.USER_SEARCH_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    by_id = User.objects.in_bulk(page.object_list)
+    users = [by_id[pk] for pk in page.object_list if pk in by_id]
+    return render(request, 'search_users.html', {'users': users, 'page': page, 'query': query})
+
+
+@login_required
+@require_safe
+def search_typeahead(request):
+    # GET ?q=jo -> up to TYPEAHEAD_LIMIT users whose username or name starts
+    # with q, the viewer's friends first. Served from core.typeahead's
+    # in-memory index.
+    matches = typeahead.index.lookup(request.GET.get('q', ''), viewer_id=request.user.pk)
+    return JsonResponse({'results': [
+        {
+            'username': username,
+            'name': name,
+            'friend': is_friend,
+            'url': reverse('user_profile', args=[username]),
+        }
+        for _, username, name, is_friend in matches
+    ]})
+
+
+@login_required
+@require_safe
+def search_posts(request):
+    # Posts and comments matching ?q= (words, "phrases", prefix*) among the
+    # viewer's own and friends' posts, newest first, a cursor page at a time.
+    query = request.GET.get('q', '')
+    try:
+        posts, next_cursor = post_search.search_posts(
+            request.user, query,
+            cursor=request.GET.get('cursor'),
+            page_size=settings.POST_SEARCH_PAGE_SIZE,
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+    return render(request, 'search_posts.html', {
+        'posts': posts, 'next_cursor': next_cursor, 'query': query,
+    })
 
 
 # ---------------- SIDEBAR VIEW ----------------
 @login_required
 def sidebar(request):
-    user_profile = UserProfile.objects.filter(user=request.user).first()
-    friends = user_profile.followers.all() if user_profile else []
-    return render(request, 'sidebar.html', {'friends': friends})
+    return render(request, 'sidebar.html', {'friends': sidebar_friends(request.user.pk)})
 
 
 
@@ -322,26 +470,22 @@ def accept_friend_request(request, request_id):
     # Add each other as friends.
     sender_profile.friends.add(receiver_profile)
     receiver_profile.friends.add(sender_profile)
+
+    # Seed both home timelines with the new friend's recent posts.
+    enqueue('backfill_friendship', user_a_id=friend_request.sender_id, user_b_id=request.user.pk)
     
     messages.success(request, "Friend request accepted!")
     return redirect('view_friend_requests')  # or redirect to an appropriate page
 @login_required
 def suggest_friends(request):
-    user_profile = request.user.userprofile
-    all_profiles = User.objects.exclude(id=request.user.id)
-    suggestions = []
-
-    for other_user in all_profiles:
-        mutual_friends = user_profile.get_mutual_friends(other_user)
-        if mutual_friends.exists() and not user_profile.friends.filter(user=other_user).exists():
-            suggestions.append({
-                'user': other_user,
-                'mutual_count': mutual_friends.count(),
-                'mutual_names': [friend.username for friend in mutual_friends],
-            })
-
+    # Ranked friend-of-friend candidates, cached per user by
+    # core.suggestions; this page costs one cache read and one user lookup.
+    suggestions = get_suggestions(request.user.pk)
+    users = User.objects.in_bulk([s['user_id'] for s in suggestions])
+    suggestions = [
+        {**s, 'user': users[s['user_id']]} for s in suggestions if s['user_id'] in users
+    ]
     return render(request, 'friend_suggestions.html', {'suggestions': suggestions})
-User = get_user_model()
 
 @login_required
 def user_profile(request, username):
@@ -361,10 +505,8 @@ def user_profile(request, username):
         # Retrieve pending friend requests where the logged-in user is the receiver
         friend_requests = FriendRequest.objects.filter(receiver=request.user, accepted=False)
     else:
-        # When viewing someone else's profile, get the logged-in user's profile object
-        current_profile, _ = UserProfile.objects.get_or_create(user=request.user)
         # Check if the logged-in user is already friends with this profile owner
-        is_friend = current_profile.friends.filter(pk=profile.pk).exists()
+        is_friend = db_are_friends(request.user.pk, profile_user.pk)
         # Also check if a friend request is already pending
         friend_request_sent = FriendRequest.objects.filter(
             sender=request.user, receiver=profile_user, accepted=False
@@ -373,7 +515,13 @@ def user_profile(request, username):
     posts = []
     if is_friend:
         # Show posts only if the logged-in user is friends with the profile owner (or it’s their own profile)
-        posts = Post.objects.filter(user=profile_user).order_by('-created_at')
+        posts = list(Post.objects.filter(user=profile_user).select_related('user').order_by('-created_at'))
+        # Cards come from the fragment cache; only the viewer's likes are looked up.
+        liked = liked_post_ids(request.user, [post.pk for post in posts])
+        for post in posts:
+            post.liked_by_user = post.pk in liked
+        if like_buffer.enabled():
+            like_buffer.apply_buffered_counts(posts)
     
     context = {
          'profile_user': profile_user,  # The user object for the profile being viewed
@@ -392,10 +540,11 @@ def remove_friend(request, username):
     friend_profile = get_object_or_404(UserProfile, user__username=username)
     current_profile = get_object_or_404(UserProfile, user=request.user)
     
-    if current_profile.friends.filter(pk=friend_profile.pk).exists():
+    if db_are_friends(request.user.pk, friend_profile.user_id):
         # Remove the friend from both users.
         current_profile.friends.remove(friend_profile)
         friend_profile.friends.remove(current_profile)
+        purge_friendship(request.user.pk, friend_profile.user_id)
         
         # Optional: Clean up any existing friend request records between these users.
         from core.models import FriendRequest  # Import here if necessary.
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 
 
@@ -21,8 +24,121 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploaded media is stored once per content digest (see core.storage).
+STORAGES = {
+    'default': {
+        'BACKEND': 'core.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 LOGIN_URL = '/login/'
 
+# Number of posts per feed page; clients may ask for up to FEED_MAX_PAGE_SIZE.
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+
+# Most post ids the batch like-state endpoint answers for in one request.
+LIKE_STATE_MAX_IDS = 100
+
+# Write-behind likes (core.like_buffer): toggles go to a journal in the
+# LIKE_BUFFER_CACHE cache and are written to the database in bulk every
+# LIKE_FLUSH_INTERVAL seconds. Needs a cache shared by web and worker
+# processes.
+LIKES_WRITE_BEHIND = False
+LIKE_BUFFER_CACHE = 'counters'
+LIKE_FLUSH_INTERVAL = 2
+
+# Home timelines keep at most this many entries per user; older ones are
+# trimmed on fan-out. A new friendship copies this many recent posts each way.
+TIMELINE_MAX_LENGTH = 800
+TIMELINE_BACKFILL_POSTS = 50
+# Authors with more friends than this are not fanned out on write; their
+# posts are merged into readers' feeds at read time instead.
+TIMELINE_FANOUT_MAX_FRIENDS = 1000
+
+# Friend-of-friend suggestions kept per user, and how long the cached list
+# lives if no friendship change invalidates it first.
+FRIEND_SUGGESTIONS_CACHE = 'feed'
+FRIEND_SUGGESTIONS_LIMIT = 20
+FRIEND_SUGGESTIONS_TIMEOUT = 6 * 60 * 60
+
+# Per-user sorted friend id arrays (core.friend_graph). They are dropped on
+# every friendship change; the timeout only bounds how long a missed update
+# could linger.
+FRIEND_GRAPH_CACHE = 'feed'
+FRIEND_GRAPH_TIMEOUT = 24 * 60 * 60
+
+# The sidebar friends list is cached per user under a version that friendship
+# changes bump; this only bounds how long superseded versions linger.
+SIDEBAR_CACHE = 'fragments'
+SIDEBAR_CACHE_TIMEOUT = 60 * 60
+
+# Rendered post cards (core.fragments) are kept in POST_CARD_CACHE for up to
+# POST_CARD_CACHE_TIMEOUT seconds; edits, likes and comments re-render them
+# sooner.
+POST_CARD_CACHE = 'fragments'
+POST_CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+# User search (core.search): at most USER_SEARCH_MAX_RESULTS ranked matches,
+# USER_SEARCH_PAGE_SIZE per page; query words past USER_SEARCH_MAX_TERMS are
+# ignored.
+USER_SEARCH_MAX_RESULTS = 200
+USER_SEARCH_PAGE_SIZE = 20
+USER_SEARCH_MAX_TERMS = 5
+
+# Search-box typeahead (core.typeahead): suggestions returned per keystroke,
+# index entries scanned at most per lookup, and how long the cross-process
+# change journal is kept (a process that falls further behind reloads).
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_SCAN_LIMIT = 2000
+TYPEAHEAD_JOURNAL_TIMEOUT = 24 * 60 * 60
+
+# Post search (core.post_search): results per page, and words or phrases
+# past POST_SEARCH_MAX_TERMS in a query are ignored.
+POST_SEARCH_PAGE_SIZE = 20
+POST_SEARCH_MAX_TERMS = 8
+
+# Fixed-width copies generated for every uploaded image and offered to
+# browsers through srcset. 40 and 80 are the 1x and 2x feed avatars; run
+# `manage.py generate_image_variants --all` after changing these.
+IMAGE_VARIANT_WIDTHS = (40, 80, 320, 640, 1080)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 82
+
+# Background jobs (core.jobs). Failed jobs are retried after
+# JOB_RETRY_DELAY * 2**(attempt - 1) seconds; a job left running for longer
+# than JOB_LOCK_TIMEOUT seconds is assumed orphaned and is requeued.
+# JOBS_RUN_INLINE (set after DEBUG below) runs each job in-process right
+# after the enqueuing transaction commits, for development without a worker.
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_LOCK_TIMEOUT = 600
+
+# Deleted media is removed in batches by a purge job scheduled this many
+# seconds after the first deletion. The orphan sweep ignores files younger
+# than MEDIA_ORPHAN_GRACE seconds (uploads whose row isn't committed yet).
+MEDIA_PURGE_DELAY = 60
+MEDIA_PURGE_BATCH_SIZE = 500
+MEDIA_ORPHAN_GRACE = 24 * 60 * 60
+
+# Chunked video uploads (core.uploads). Clients send at most
+# VIDEO_UPLOAD_CHUNK_SIZE bytes per request; uploads that receive nothing for
+# VIDEO_UPLOAD_EXPIRY seconds are discarded by `manage.py purge_media`.
+VIDEO_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+VIDEO_UPLOAD_CHUNK_SIZE = 8 * 1024 ** 2
+VIDEO_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Media serving (core.serving). Content-addressed blobs are cached forever;
+# other files for MEDIA_CACHE_MAX_AGE seconds. Set MEDIA_ACCEL_REDIRECT to an
+# internal nginx location (e.g. '/protected-media/') or MEDIA_SENDFILE_HEADER
+# to 'X-Sendfile' to let the web server send the file bytes.
+MEDIA_CACHE_MAX_AGE = 60 * 60
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_SENDFILE_HEADER = None
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
@@ -37,6 +153,10 @@ SECRET_KEY = 'django-insecure-2akf_p8r)!$&m#l_7l06j%y2&%xv#^e6sl=yu+kgt_)=59#)6j
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Jobs run inline under DEBUG, so `runserver` works without `run_worker`;
+# set JOBS_RUN_INLINE=0 or 1 in the environment to choose explicitly.
+JOBS_RUN_INLINE = os.environ.get('JOBS_RUN_INLINE', '1' if DEBUG else '0') == '1'
+
 ALLOWED_HOSTS = []
 
 
@@ -87,9 +207,78 @@ TEMPLATES = [
 WSGI_APPLICATION = 'social_media_feed.wsgi.application'
 
 
+# Caches. Each alias is a separate cache so it can be sized, flushed or
+# moved to a server on its own:
+#   default    small shared state (job scheduling, the typeahead journal)
+#   sessions   sessions, in front of the database (cached_db)
+#   fragments  rendered post cards and sidebar friend lists
+#   feed       friend graph arrays and friend suggestions
+#   counters   the write-behind like buffer
+# CACHE_BACKEND picks the backend for all of them: 'locmem' (per process,
+# the default), 'file' (under CACHE_DIR, shared by processes on one host),
+# or 'redis' / 'memcached' at CACHE_URL (shared by every process; needs the
+# redis or pymemcache package). With CACHE_URL set, the backend defaults to
+# its scheme. social_media_feed.test_settings pins local-memory caches for
+# the test suite, whatever the environment says.
+#
+# Outside DEBUG, default, feed and counters must be shared by every web and
+# worker process: they hold the typeahead journal, the friend graph and the
+# like buffer, which other processes read or invalidate. `manage.py check
+# --deploy` warns (core.W001) when they are per-process.
+CACHE_URL = os.environ.get('CACHE_URL', '')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND') or CACHE_URL.partition('://')[0] or 'locmem'
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+# Entries each local cache holds before culling; the like buffer must not
+# lose journal entries, so counters gets the most room.
+CACHE_MAX_ENTRIES = {
+    'default': 1000,
+    'sessions': 10000,
+    'fragments': 10000,
+    'feed': 10000,
+    'counters': 100000,
+}
+
+
+def cache_config(alias, backend=CACHE_BACKEND):
+    if backend == 'locmem':
+        return {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': alias,
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES[alias]},
+        }
+    if backend == 'file':
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, alias),
+            'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES[alias]},
+        }
+    if backend in ('redis', 'rediss'):
+        package, config = 'redis', {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    elif backend == 'memcached':
+        package, config = 'pymemcache', {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.partition('://')[2].split(','),
+        }
+    else:
+        raise ImproperlyConfigured(f"Unknown CACHE_BACKEND {backend!r}.")
+    if not CACHE_URL:
+        raise ImproperlyConfigured(f"CACHE_BACKEND {backend!r} needs CACHE_URL.")
+    if importlib.util.find_spec(package) is None:
+        raise ImproperlyConfigured(f"CACHE_BACKEND {backend!r} needs the {package} package.")
+    # The aliases share one server; prefixes keep their keys apart.
+    return {**config, 'KEY_PREFIX': alias}
+
+
+CACHES = {alias: cache_config(alias) for alias in CACHE_MAX_ENTRIES}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
 
 DATABASES = {
     'default': {
@@ -0,0 +1,14 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=social_media_feed.test_settings
+
+The same as settings, except that every cache is a fresh local-memory one,
+so a CACHE_URL in the environment can't point tests at a shared server.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHE_MAX_ENTRIES, cache_config
+
+CACHE_BACKEND = 'locmem'
+CACHES = {alias: cache_config(alias, CACHE_BACKEND) for alias in CACHE_MAX_ENTRIES}